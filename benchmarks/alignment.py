@@ -0,0 +1,69 @@
+import argparse, os, sys, time
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+os.chdir(ROOT)
+
+from utils.audio import AudioGenerator, SAMPLE_RATE
+from fakes import SineTTS
+
+WORDS = (
+    "redditors am I wrong for what I did my sister planned the whole thing behind my back "
+    "and when the truth finally came out at the funeral nobody could look me in the eye"
+).split()
+
+def random_groups(count: int, rng: np.random.Generator):
+    groups = []
+    for _ in range(count):
+        size = int(rng.integers(3, 18))
+        groups.append(" ".join(rng.choice(WORDS, size)) + ".")
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description="word alignment overhead and timing error against the sine TTS stub")
+    parser.add_argument("--groups", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # the reference word starts are the stub's own layout; the real model gives no
+    # word timings to compare against, so these errors say nothing about VITS speech
+    tts = SineTTS(seconds_per_char=0.0537, word_gap=0.0613)
+    generator = AudioGenerator()
+    groups = random_groups(args.groups, rng)
+
+    audio_seconds = 0.0
+    align_seconds = 0.0
+    even_errors = []
+    aligned_errors = []
+    for group, raw in zip(groups, tts.synthesize(groups)):
+        words = group.split()
+        start_idx, end_idx = generator._find_audio_bounds(raw, SAMPLE_RATE)
+        audio = (raw[start_idx:end_idx] * 32767).astype(np.int16)
+        audio_seconds += len(audio) / SAMPLE_RATE
+
+        # reference word starts, shifted into the trimmed clip
+        reference = np.array([start for start, _ in tts.word_layout(group)]) - start_idx / SAMPLE_RATE
+
+        started = time.perf_counter()
+        bounds = generator._align_words(audio, words)
+        align_seconds += time.perf_counter() - started
+
+        even = generator._block_timestamps(group, 0.0, len(audio) / SAMPLE_RATE)
+        aligned = generator._block_timestamps(group, 0.0, len(audio) / SAMPLE_RATE, bounds)
+        # the first word always starts at the clip start, measure the rest
+        even_errors.extend(np.abs(np.array([w["start"] for b in even for w in b["words"]]) - reference)[1:])
+        aligned_errors.extend(np.abs(np.array([w["start"] for b in aligned for w in b["words"]]) - reference)[1:])
+
+    minutes = audio_seconds / 60
+    print("reference: sine TTS stub word layout (tone bursts with silent gaps), not VITS speech")
+    print(f"audio: {minutes:.1f} min in {len(groups)} groups")
+    print(f"alignment overhead: {align_seconds * 1000 / minutes:.1f} ms per minute of audio")
+    for name, errors in (("even split", even_errors), ("aligned", aligned_errors)):
+        errors = np.array(errors) * 1000
+        print(f"{name:11s} word start error (stub): mean {errors.mean():6.1f} ms  p95 {np.percentile(errors, 95):6.1f} ms  max {errors.max():6.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse, os, random, subprocess, sys, tempfile, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+os.chdir(ROOT)
+
+from utils.probe import ProbeIndex
+from utils.backgrounds import BackgroundHistory, BackgroundScheduler, sequential_plan, write_concat_list
+from fakes import make_clip
+
+LIBRARY = "./cache/bench/library"
+
+def make_library(folder: str, lengths, size: str, fps: int):
+    # short and long clips mixed, like a real folder of downloaded footage
+    for i, seconds in enumerate(lengths):
+        make_clip(os.path.join(folder, f"clip_{i:02d}_{seconds}s.mp4"), f"testsrc2=size={size}:rate={fps},hue=H={i}", seconds, fps)
+
+def decode(plan, work_dir: str) -> float:
+    # what every render pays before filtering: open, seek and decode each piece
+    concat_file = os.path.join(work_dir, "concat.txt")
+    write_concat_list(plan, concat_file)
+    started = time.perf_counter()
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "concat", "-safe", "0", "-i", concat_file, "-map", "0:v", "-f", "null", "-"], check=True)
+    return time.perf_counter() - started
+
+def reused(plan, earlier) -> float:
+    # seconds of this render already shown by an earlier one
+    seconds = 0.0
+    for entry in plan:
+        name = BackgroundHistory.footage(entry["path"])
+        ranges = [(e["inpoint"], e["outpoint"]) for p in earlier for e in p if BackgroundHistory.footage(e["path"]) == name]
+        seconds += sum(max(0.0, min(entry["outpoint"], b) - max(entry["inpoint"], a)) for a, b in ranges)
+    return seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="background decode time and footage reuse per render, sequential vs scheduled")
+    parser.add_argument("--renders", type=int, default=6)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[4, 5, 6, 8, 10, 60, 90, 120])
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    make_library(LIBRARY, args.lengths, args.size, args.fps)
+    clips = ProbeIndex(LIBRARY).refresh()
+    lengths = ", ".join(f"{clip['duration']:.0f}s" for clip in clips)
+    print(f"{len(clips)} clips ({lengths}), {args.renders} renders of {args.seconds:.0f}s")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        scheduler = BackgroundScheduler(BackgroundHistory(os.path.join(work_dir, "history.json")), random.Random(args.seed))
+        for name, make_plan in (("sequential", sequential_plan), ("scheduled", scheduler.plan)):
+            plans = []
+            total = 0.0
+            for render in range(args.renders):
+                plan = make_plan(clips, args.seconds)
+                elapsed = decode(plan, work_dir)
+                total += elapsed
+                print(f"  {name:10s} render {render + 1}  {len(plan):2d} pieces  {len({e['path'] for e in plan}):2d} files  "
+                      f"decode {elapsed:5.2f}s  reused {reused(plan, plans):5.1f}s")
+                plans.append(plan)
+            print(f"{name:10s} mean decode {total / args.renders:5.2f}s per render\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeOllama:
+    # minimal stand-in for `ollama serve`: /api/generate streams canned chunks as
+    # NDJSON with a fixed delay between them, like a model producing tokens
+    def __init__(self, story_chunks, caption="A shocking tale of betrayal.", delay=0.02, model="fake", parallel=None):
+        # caption may be a list of chunks; parallel caps concurrent requests like OLLAMA_NUM_PARALLEL
+        self.story_chunks = list(story_chunks)
+        self.caption_chunks = [caption] if isinstance(caption, str) else list(caption)
+        self.delay = delay
+        self.model = model
+        self.requests = []
+        self._slots = threading.Semaphore(parallel) if parallel else None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake.requests.append((self.path, body))
+                if self.path != "/api/generate":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                prompt = body.get("prompt", "")
+                chunks = fake.caption_chunks if prompt.startswith("Generate a short, catchy caption") else fake.story_chunks
+                if (body.get("options") or {}).get("num_predict") is not None:
+                    chunks = chunks[:1]
+                if fake._slots:
+                    fake._slots.acquire()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    if body.get("stream", True) is False:
+                        time.sleep(fake.delay * len(chunks))
+                        self._write_line("".join(chunks), True)
+                        return
+                    for chunk in chunks:
+                        time.sleep(fake.delay)
+                        self._write_line(chunk, False)
+                    self._write_line("", True)
+                finally:
+                    if fake._slots:
+                        fake._slots.release()
+
+            def _write_line(self, text, done):
+                line = {"model": fake.model, "created_at": "2024-01-01T00:00:00Z", "response": text, "done": done}
+                self.wfile.write((json.dumps(line) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,80 @@
+import json, os, re, subprocess, sys, time, zlib
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+SAMPLE_RATE = 24000
+
+class SineTTS:
+    # deterministic stand-in for VitsBackend: one tone burst per word, its
+    # length proportional to the word, its pitch derived from the word's hash
+    def __init__(self, seconds_per_char=0.06, word_gap=0.05, padding=0.1, amplitude=0.4, realtime_factor=0.0):
+        # realtime_factor > 0 sleeps that fraction of the produced audio to mimic model cost
+        self.realtime_factor = realtime_factor
+        self.seconds_per_char = seconds_per_char
+        self.word_gap = word_gap
+        self.padding = padding
+        self.amplitude = amplitude
+
+    def word_layout(self, group: str):
+        # (start, end) of every word in seconds, relative to the untrimmed clip
+        layout = []
+        position = self.padding
+        for word in group.split():
+            length = max(1, len(word)) * self.seconds_per_char
+            layout.append((position, position + length))
+            position += length + self.word_gap
+        return layout
+
+    def synthesize(self, groups):
+        results = []
+        for group in groups:
+            layout = self.word_layout(group)
+            if not layout:
+                results.append(np.zeros(0, dtype=np.float32))
+                continue
+            total = layout[-1][1] + self.padding
+            audio = np.zeros(int(total * SAMPLE_RATE), dtype=np.float32)
+            for word, (start, end) in zip(group.split(), layout):
+                first, last = int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)
+                t = np.arange(last - first) / SAMPLE_RATE
+                frequency = 120 + zlib.crc32(word.encode("utf-8")) % 180
+                audio[first:last] = self.amplitude * np.sin(2 * np.pi * frequency * t)
+            results.append(audio)
+        if self.realtime_factor:
+            time.sleep(self.realtime_factor * sum(len(audio) for audio in results) / SAMPLE_RATE)
+        return results
+
+class NullClient:
+    # stands in for the ollama client where a run must never reach the server
+    def __getattr__(self, name):
+        raise RuntimeError(f"unexpected ollama call: {name}")
+
+def token_chunks(text: str):
+    # roughly what a model streams: words with their leading whitespace
+    return re.findall(r"\s*\S+", text)
+
+def make_clip(path: str, source: str, seconds: float, fps: int):
+    # synthetic footage from an ffmpeg lavfi source, with a keyframe every 2s like
+    # downloaded clips; kept between runs
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", source,
+        "-t", str(seconds), "-pix_fmt", "yuv420p",
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(fps * 2),
+        path + ".part.mp4"
+    ], check=True)
+    os.replace(path + ".part.mp4", path)
+
+def run_isolated(script: str, *args) -> dict:
+    # runs `script --case ...` in its own interpreter, so the peak RSS it reports
+    # belongs to that case alone; the case prints its result as the last line
+    output = subprocess.check_output([sys.executable, script, "--case", *args], cwd=ROOT, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+def print_case_result(result: dict):
+    # progress output may have left the line open
+    print("\n" + json.dumps(result))
@@ -0,0 +1,84 @@
+import argparse, os, shutil, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+os.chdir(ROOT)
+
+from utils import models, story
+from utils.llm import OllamaPool
+from utils.story import StoryGenerator
+from fake_ollama import FakeOllama
+from fakes import token_chunks
+
+CACHE_DIR = "./cache/bench/prompts"
+
+class OwnClient(StoryGenerator):
+    # a generator with a client of its own instead of the process-wide pool
+    def __init__(self, client, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client
+
+def timed(story_gen, prompt: str):
+    started = time.perf_counter()
+    generated = story_gen.generate(prompt)
+    return time.perf_counter() - started, generated
+
+def concurrent(generators, prompt: str):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(generators)) as pool:
+        list(pool.map(lambda story_gen: timed(story_gen, prompt), generators))
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="story + caption wall time and throughput against a fake ollama")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--caption-tokens", type=int, default=20)
+    parser.add_argument("--repeat-story", type=int, default=2)
+    parser.add_argument("--jobs", type=int, default=4, help="stories generated together for the throughput run")
+    parser.add_argument("--parallel", type=int, default=4, help="requests the fake server handles at once (OLLAMA_NUM_PARALLEL)")
+    args = parser.parse_args()
+
+    text = " ".join([story._TEST_STORY] * args.repeat_story)
+    caption = token_chunks(" ".join(["A shocking tale of betrayal."] * args.caption_tokens))[:args.caption_tokens]
+    fake = FakeOllama(token_chunks(text), caption=caption, delay=1.0 / args.tokens_per_second, parallel=args.parallel).start()
+    try:
+        models.inject("ollama", OllamaPool(fake.url, max_connections=max(args.jobs, 2) * 2))
+        story._test = False
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+        print(f"{len(text.split())} words at {args.tokens_per_second:.0f} tokens/s, caption {len(caption)} tokens")
+        after, _ = timed(StoryGenerator("fake", caption_after_chars=0), "prompt")
+        print(f"caption after story   {after:6.2f}s")
+        early, _ = timed(StoryGenerator("fake"), "prompt")
+        print(f"caption from opening  {early:6.2f}s  ({after - early:+.2f}s saved)")
+
+        seeded = StoryGenerator("fake", options={"seed": 42}, cache_dir=CACHE_DIR)
+        cold, first = timed(seeded, "prompt")
+        warm, second = timed(seeded, "prompt")
+        print(f"seeded, cold cache    {cold:6.2f}s")
+        print(f"seeded, warm cache    {warm:6.2f}s  identical: {first == second}  ({seeded.cache.stats()})")
+
+        # the same jobs in threads either way, so only the client differs
+        clients = [OllamaPool(fake.url) for _ in range(args.jobs)]
+        try:
+            separate = concurrent([OwnClient(client, "fake") for client in clients], "prompt")
+        finally:
+            for client in clients:
+                client.close()
+        shared = concurrent([StoryGenerator("fake") for _ in range(args.jobs)], "prompt")
+        print(f"{args.jobs} jobs, a client each   {separate:6.2f}s  {args.jobs / separate * 60:6.1f} stories/min")
+        print(f"{args.jobs} jobs on one pool      {shared:6.2f}s  {args.jobs / shared * 60:6.1f} stories/min")
+    finally:
+        models.unload("ollama")
+        fake.stop()
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
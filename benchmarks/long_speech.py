@@ -0,0 +1,75 @@
+import argparse, os, resource, sys, time, zlib
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "benchmarks"))
+from fakes import run_isolated, print_case_result
+
+class Sink:
+    # reads every byte, as the pipe into ffmpeg does; /dev/null would never touch the pages
+    def __init__(self):
+        self.checksum = 0
+
+    def write(self, data):
+        self.checksum = zlib.crc32(data, self.checksum)
+
+def run_case(minutes: float, buffer_dir: str) -> dict:
+    # runs inside its own interpreter so the peak RSS belongs to this length alone
+    sys.path.insert(0, str(ROOT / "src"))
+    from utils import models, story
+    from utils.audio import AudioGenerator
+    from fakes import SineTTS
+    models.inject("tts", SineTTS())
+    audio_gen = AudioGenerator(batch_size=4, buffer_dir=buffer_dir)
+
+    words = story._TEST_STORY.split()
+    # the sine stub speaks about 0.4s per word of the canned story
+    repeat = int(minutes * 60 / (len(words) * 0.4)) + 1
+
+    def groups():
+        # produced lazily, like a story that is still streaming in
+        for _ in range(repeat):
+            yield from audio_gen._split_into_groups(story._TEST_STORY)
+
+    started = time.perf_counter()
+    track, timestamps = audio_gen.speak_groups(groups())
+    spoken = time.perf_counter()
+    assembled_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    track.write_to(Sink())
+    return {
+        "minutes": minutes,
+        "audio_seconds": round(track.duration, 1),
+        "audio_mb": round(track.nbytes / 1024 / 1024, 1),
+        "blocks": len(timestamps),
+        "speak_seconds": round(spoken - started, 2),
+        "feed_seconds": round(time.perf_counter() - spoken, 2),
+        "assembled_rss_mb": round(assembled_rss, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="peak memory while speaking and feeding very long stories with the sine TTS stub")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 60])
+    parser.add_argument("--max-rss-mb", type=float, default=256, help="fail when any length peaks above this")
+    parser.add_argument("--buffer-dir", help="where the speech is spooled (default: the system temp folder)")
+    parser.add_argument("--case", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    os.chdir(ROOT)
+
+    if args.case is not None:
+        print_case_result(run_case(args.case, args.buffer_dir))
+        return
+
+    failed = False
+    for minutes in args.minutes:
+        result = run_isolated(__file__, str(minutes), *(["--buffer-dir", args.buffer_dir] if args.buffer_dir else []))
+        over = result["peak_rss_mb"] > args.max_rss_mb
+        failed = failed or over
+        print(f"{minutes:6.1f} min  {result['audio_mb']:7.1f} MB audio  {result['blocks']:6d} blocks  "
+              f"speak {result['speak_seconds']:7.2f}s  feed {result['feed_seconds']:5.2f}s  "
+              f"rss assembled {result['assembled_rss_mb']:6.1f} MB  peak {result['peak_rss_mb']:6.1f} MB"
+              f"{'  over ' + str(args.max_rss_mb) + ' MB' if over else ''}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import argparse, copy, json, os, platform, subprocess, sys, time
+from pathlib import Path
+from fakes import make_clip, run_isolated, print_case_result
+
+ROOT = Path(__file__).resolve().parents[1]
+BENCH_DIR = "./cache/bench"
+
+# fractional changes against the baseline that count as a regression
+DEFAULT_TOLERANCE = 0.15
+
+def make_backgrounds(folder: str, count: int, seconds: float, size: str, fps: int):
+    # synthetic footage with real motion and detail, so the encoder does representative work
+    sources = (
+        "testsrc2=size={size}:rate={fps}",
+        "testsrc2=size={size}:rate={fps},hue=H=2*PI*t/10",
+        "testsrc2=size={size}:rate={fps},hflip,hue=s=0.5"
+    )
+    for i in range(count):
+        path = os.path.join(folder, f"synthetic_{i}_{size}_{fps}.mp4")
+        make_clip(path, sources[i % len(sources)].format(size=size, fps=fps), seconds, fps)
+
+def case_config(base: dict, case: dict) -> dict:
+    config = copy.deepcopy(base)
+    config["debug"] = False
+    config["config"]["video_resolution"] = case["resolution"]
+    config["config"]["video_fps"] = case["fps"]
+    config["config"]["stream_tts"] = case["stream"]
+    config["config"]["tts_workers"] = 0
+    config["paths"]["video_backgrounds"] = os.path.join(BENCH_DIR, "backgrounds")
+    config["paths"]["prepared_backgrounds"] = os.path.join(BENCH_DIR, "prepared") if case["prepared"] else None
+    config["paths"]["output_video"] = os.path.join(BENCH_DIR, "output")
+    config["paths"]["tts_cache"] = None
+    config["paths"]["prompt_cache"] = None
+    config["paths"]["probe_index"] = os.path.join(BENCH_DIR, "probe_index.json")
+    config["paths"]["background_history"] = None
+    config["profiling"] = {}
+    return config
+
+def stage_times(events):
+    # total milliseconds per span name; parallel segments are folded into one row
+    stages = {}
+    for event in events:
+        if event["ph"] != "X":
+            continue
+        name = "segment" if event["name"].startswith("segment_") else event["name"]
+        stages[name] = round(stages.get(name, 0) + event["dur"] / 1000, 1)
+    return stages
+
+def run_case(case: dict) -> dict:
+    # runs inside its own interpreter so peak RSS belongs to this case alone
+    sys.path.insert(0, str(ROOT / "src"))
+    sys.path.insert(0, str(ROOT / "benchmarks"))
+    from utils import models, story
+    from utils.trace import tracer
+    from fakes import SineTTS, NullClient
+    models.inject("tts", SineTTS(realtime_factor=case["realtime_factor"]))
+    models.inject("ollama", NullClient())
+    story._test = True
+    story._TEST_STORY = " ".join([story._TEST_STORY] * case["repeat"])
+    import main
+
+    tracer.enable()
+    app = main.App(case_config(main.cfg, case))
+    started = time.perf_counter()
+    generated, audio, timestamps = app.speak(main.cfg["story_prompt"])
+    spoken = time.perf_counter()
+    output_name = f"bench_{case['repeat']}x_{case['resolution']}.mp4"
+    video_files = app.render(audio, timestamps, output_name, case.get("profiles"))
+    finished = time.perf_counter()
+    app.audio_gen.close()
+
+    result = {
+        "case": case,
+        "words": len(generated["story"].split()),
+        "audio_seconds": round(audio.duration, 2),
+        "speech_seconds": round(spoken - started, 3),
+        "render_seconds": round(finished - spoken, 3),
+        "end_to_end_seconds": round(finished - started, 3),
+        "stages_ms": stage_times(tracer.events),
+        "audio_bytes": audio.nbytes,
+        "video_bytes": sum(os.path.getsize(video_file) for video_file in video_files),
+        **tracer.summary()
+    }
+    for video_file in video_files:
+        os.remove(video_file)
+    return result
+
+def case_key(case: dict) -> str:
+    profiles = f" [{', '.join(case['profiles'])}]" if case.get("profiles") else ""
+    return f"{case['repeat']}x story @ {case['resolution']}{profiles}"
+
+def environment() -> dict:
+    ffmpeg = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip()
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "ffmpeg": ffmpeg
+    }
+
+def compare(results: list, baseline: dict, tolerance: float) -> bool:
+    # returns True when something got slower or bigger by more than the tolerance
+    previous = {case_key(result["case"]): result for result in baseline["results"]}
+    regressed = False
+    print(f"\ncompared with {baseline['environment']['commit']} ({baseline['environment']['created']}):")
+    for result in results:
+        key = case_key(result["case"])
+        before = previous.get(key)
+        if not before:
+            print(f"  {key}: not in baseline")
+            continue
+        rows = [("end_to_end_seconds", result["end_to_end_seconds"], before["end_to_end_seconds"]),
+                ("peak_rss_mb", result["peak_rss_mb"], before["peak_rss_mb"]),
+                ("video_bytes", result["video_bytes"], before["video_bytes"])]
+        rows += [(f"stage {name}", value, before["stages_ms"][name])
+                 for name, value in result["stages_ms"].items() if before["stages_ms"].get(name)]
+        print(f"  {key}:")
+        for name, now, then in rows:
+            change = (now - then) / then if then else 0.0
+            flag = ""
+            if change > tolerance and not name.startswith("stage "):
+                flag = "  regression"
+                regressed = True
+            print(f"    {name:24s} {then:>12} -> {now:>12}  {change:+7.1%}{flag}")
+    return regressed
+
+def print_result(result: dict):
+    case = result["case"]
+    print(f"\n{case_key(case)} ({result['words']} words, {result['audio_seconds']:.1f}s audio)")
+    print(f"  end to end {result['end_to_end_seconds']:8.2f}s  speech {result['speech_seconds']:.2f}s  render {result['render_seconds']:.2f}s")
+    print(f"  peak rss   {result['peak_rss_mb']:8.1f} MB  ffmpeg peak {result['children_peak_rss_mb']:.1f} MB")
+    print(f"  output     {result['video_bytes'] / 1e6:8.2f} MB video  {result['audio_bytes'] / 1e6:.2f} MB audio")
+    for name, ms in sorted(result["stages_ms"].items(), key=lambda item: -item[1]):
+        print(f"    {name:14s} {ms:10.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end benchmark with a canned story, sine-tone TTS and synthetic backgrounds")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 4], help="how many times the canned story is repeated")
+    parser.add_argument("--resolutions", nargs="+", default=["540x960", "1080x1920"])
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--profiles", nargs="+", help="encoder profiles rendered together in every case")
+    parser.add_argument("--realtime-factor", type=float, default=0.0, help="stub TTS cost per second of audio")
+    parser.add_argument("--no-stream", action="store_true", help="generate the whole story before speaking it")
+    parser.add_argument("--prepared", action="store_true", help="render from prepared backgrounds (prepared once, not timed)")
+    parser.add_argument("--background-seconds", type=float, default=60)
+    parser.add_argument("--output", help="where to save the results (default: ./output/benchmarks/pipeline_<time>.json)")
+    parser.add_argument("--baseline", help="a previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    os.chdir(ROOT)
+
+    if args.case:
+        print_case_result(run_case(json.loads(args.case)))
+        return
+
+    make_backgrounds(os.path.join(BENCH_DIR, "backgrounds"), 3, args.background_seconds, "1280x720", args.fps)
+    cases = [
+        {"repeat": repeat, "resolution": resolution, "fps": args.fps, "stream": not args.no_stream,
+         "prepared": args.prepared, "realtime_factor": args.realtime_factor, "profiles": args.profiles}
+        for resolution in args.resolutions for repeat in args.lengths
+    ]
+    if args.prepared:
+        sys.path.insert(0, str(ROOT / "src"))
+        import yaml
+        from utils.prepare import prepare_backgrounds
+        with open("config.yml") as f:
+            base = yaml.safe_load(f)
+        for resolution in args.resolutions:
+            prepare_backgrounds(case_config(base, {**cases[0], "resolution": resolution}))
+
+    results = []
+    for case in cases:
+        results.append(run_isolated(__file__, json.dumps(case)))
+        print_result(results[-1])
+
+    path = args.output or os.path.join("output", "benchmarks", f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"\nresults saved at: {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.tolerance) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse, json, subprocess, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# runs in a fresh interpreter so nothing is warm from a previous import
+PROBE = """
+import json, os, sys, time
+sys.path.insert(0, os.path.join(os.getcwd(), "src"))
+sys.path.insert(0, os.path.join(os.getcwd(), "benchmarks"))
+start = time.perf_counter()
+import utils.audio
+imported = time.perf_counter()
+from utils import models
+from fakes import SineTTS, NullClient
+models.inject("tts", SineTTS())
+models.inject("ollama", NullClient())
+import main
+app = main.App(main.cfg)
+built = time.perf_counter()
+print(json.dumps({"import_audio": imported - start, "build_app": built - imported}))
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="startup time benchmark with stub models")
+    parser.add_argument("--import-budget", type=float, default=1.0, help="seconds allowed for import utils.audio")
+    parser.add_argument("--app-budget", type=float, default=1.0, help="seconds allowed for App(cfg)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, "-c", PROBE], cwd=ROOT, text=True)
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    failed = False
+    for key, budget in (("import_audio", args.import_budget), ("build_app", args.app_budget)):
+        worst = max(sample[key] for sample in samples)
+        best = min(sample[key] for sample in samples)
+        status = "ok" if worst <= budget else "over budget"
+        failed |= worst > budget
+        print(f"{key:14s} best {best * 1000:8.1f} ms  worst {worst * 1000:8.1f} ms  budget {budget * 1000:.0f} ms  {status}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
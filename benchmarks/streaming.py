@@ -0,0 +1,59 @@
+import argparse, os, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+os.chdir(ROOT)
+
+from utils import models, story
+from utils.audio import AudioGenerator
+from utils.story import StoryGenerator
+from utils.pipeline import stream_story_to_speech
+from fakes import SineTTS, token_chunks
+from fake_ollama import FakeOllama
+
+def run(mode: str, story_gen, audio_gen, prompt: str):
+    first_audio = []
+    started = time.perf_counter()
+    on_audio = lambda *_: first_audio.append(time.perf_counter()) if not first_audio else None
+    if mode == "sequential":
+        generated = story_gen.generate(prompt)
+        _, timestamps = audio_gen.speak_groups(audio_gen._split_into_groups(generated["story"]), on_audio=on_audio)
+    else:
+        generated, _, timestamps = stream_story_to_speech(story_gen, audio_gen, prompt, on_audio=on_audio)
+    total = time.perf_counter() - started
+    return first_audio[0] - started, total, generated, timestamps
+
+def main():
+    parser = argparse.ArgumentParser(description="sequential vs streaming story-to-speech against a fake ollama")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--realtime-factor", type=float, default=0.05, help="stub TTS cost per second of audio")
+    parser.add_argument("--repeat-story", type=int, default=3)
+    args = parser.parse_args()
+
+    text = " ".join([story._TEST_STORY] * args.repeat_story)
+    fake = FakeOllama(token_chunks(text), delay=1.0 / args.tokens_per_second).start()
+    try:
+        from utils.llm import OllamaPool
+        models.inject("ollama", OllamaPool(fake.url))
+        models.inject("tts", SineTTS(realtime_factor=args.realtime_factor))
+        story._test = False
+        story_gen = StoryGenerator("fake")
+        audio_gen = AudioGenerator(batch_size=1)
+
+        results = {}
+        for mode in ("sequential", "streaming"):
+            results[mode] = run(mode, story_gen, audio_gen, "prompt")
+            first, total, _, _ = results[mode]
+            print(f"\n{mode:10s} first audio {first:6.2f}s  total {total:6.2f}s")
+
+        same_story = results["sequential"][2] == results["streaming"][2]
+        same_timestamps = results["sequential"][3] == results["streaming"][3]
+        print(f"identical story: {same_story}  identical timestamps: {same_timestamps}")
+    finally:
+        models.unload("ollama")
+        fake.stop()
+
+if __name__ == "__main__":
+    main()
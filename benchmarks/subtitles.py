@@ -0,0 +1,71 @@
+import argparse, copy, os, shutil, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+os.chdir(ROOT)
+
+import yaml
+from utils import models, story
+from utils.audio import AudioGenerator
+from utils.video import VideoCreator
+from utils.trace import tracer
+from fakes import SineTTS
+from pipeline import BENCH_DIR, case_config, make_backgrounds
+
+def speech(seconds: float):
+    # enough of the canned story, spoken by the sine stub, to cover the requested length
+    audio_gen = AudioGenerator()
+    words = story._TEST_STORY.split()
+    text = " ".join(words * int(seconds / (len(words) * 0.4) + 1))
+    track, timestamps = audio_gen.speak(text)
+    keep = [ts for ts in timestamps if ts["end"] <= seconds]
+    track.samples = track.samples[:int(seconds * track.sample_rate)]
+    return track, keep
+
+def render(base: dict, renderer: str, track, timestamps, cache: bool):
+    config = copy.deepcopy(base)
+    config["config"]["subtitle_renderer"] = renderer
+    config["paths"]["subtitle_cache"] = os.path.join(BENCH_DIR, "subtitles") if cache else None
+    video_gen = VideoCreator(config["paths"]["video_backgrounds"], config)
+    tracer.enable()
+    started = time.perf_counter()
+    output = video_gen.create_video(track, timestamps, f"subtitles_{renderer}.mp4")[0]
+    elapsed = time.perf_counter() - started
+    spans = {event["name"]: event for event in tracer.events if event["ph"] == "X"}
+    encode = spans["encode"]["args"]
+    captions = spans["captions"]["dur"] / 1e6 if "captions" in spans else 0.0
+    size = os.path.getsize(output)
+    os.remove(output)
+    return elapsed, captions, encode.get("fps", 0.0), encode.get("frames", 0), size
+
+def main():
+    parser = argparse.ArgumentParser(description="encode speed with libass subtitles vs pre-rendered caption overlays")
+    parser.add_argument("--resolution", default="1080x1920")
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--runs", type=int, default=2, help="later overlay runs reuse the caption image cache")
+    parser.add_argument("--no-cache", action="store_true", help="draw every caption image on every run")
+    args = parser.parse_args()
+
+    make_backgrounds(os.path.join(BENCH_DIR, "backgrounds"), 3, max(60, args.seconds / 2), "1280x720", 30)
+    models.inject("tts", SineTTS())
+    with open("config.yml") as f:
+        base = case_config(yaml.safe_load(f), {
+            "resolution": args.resolution, "fps": args.fps, "stream": False, "prepared": False
+        })
+    base["config"]["render_segments"] = 0
+    track, timestamps = speech(args.seconds)
+    print(f"\n{len(timestamps)} caption blocks over {track.duration:.1f}s at {args.resolution} {args.fps}fps")
+
+    # the first overlay run starts from an empty image cache
+    shutil.rmtree(os.path.join(BENCH_DIR, "subtitles"), ignore_errors=True)
+    for renderer in ("libass", "overlay"):
+        for run in range(args.runs):
+            elapsed, captions, fps, frames, size = render(base, renderer, track, timestamps, not args.no_cache)
+            print(f"{renderer:8s} run {run + 1}  total {elapsed:7.2f}s  captions {captions:6.2f}s  "
+                  f"encode {fps:7.1f} fps ({frames} frames)  {size / 1e6:.2f} MB")
+
+if __name__ == "__main__":
+    main()
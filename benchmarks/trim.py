@@ -0,0 +1,98 @@
+import argparse, os, sys, time
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+os.chdir(ROOT)
+
+from utils.audio import AudioGenerator, SAMPLE_RATE
+
+# the per-frame loops that _find_audio_bounds replaced, kept as the reference
+def find_audio_start(audio_data: np.ndarray, sr: int):
+    frame_length = int(0.01 * sr)
+    hop_length = frame_length // 2
+    energy = []
+    for i in range(0, len(audio_data) - frame_length, hop_length):
+        frame = audio_data[i:i + frame_length]
+        energy.append(np.sqrt(np.mean(frame**2)))
+    energy = np.array(energy)
+    threshold = np.max(energy) * 0.1
+    for i, e in enumerate(energy):
+        if e > threshold:
+            return max(0, i * hop_length - int(0.02 * sr))
+    return 0
+
+def find_audio_end(audio_data: np.ndarray, sr: int):
+    frame_length = int(0.01 * sr)
+    hop_length = frame_length // 2
+    energy = []
+    for i in range(0, len(audio_data) - frame_length, hop_length):
+        frame = audio_data[i:i + frame_length]
+        energy.append(np.sqrt(np.mean(frame**2)))
+    energy = np.array(energy)
+    threshold = np.max(energy) * 0.1
+    for i in range(len(energy) - 1, -1, -1):
+        if energy[i] > threshold:
+            return min(len(audio_data), (i + 1) * hop_length + int(0.02 * sr))
+    return len(audio_data)
+
+def synthetic_clip(seconds: float, rng: np.random.Generator):
+    # speech-like bursts of tone and noise with silent lead-in/out
+    num_samples = int(seconds * SAMPLE_RATE)
+    t = np.arange(num_samples) / SAMPLE_RATE
+    envelope = (np.sin(2 * np.pi * 3 * t) > -0.3).astype(np.float32)
+    audio = 0.4 * np.sin(2 * np.pi * 180 * t) * envelope + 0.02 * rng.standard_normal(num_samples)
+    lead = int(rng.uniform(0.1, 0.4) * SAMPLE_RATE)
+    tail = int(rng.uniform(0.1, 0.4) * SAMPLE_RATE)
+    audio[:lead] = 0.001 * rng.standard_normal(lead)
+    audio[-tail:] = 0.001 * rng.standard_normal(tail)
+    return audio.astype(np.float32)
+
+def best_of(fn, repeats):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="silence trimming micro-benchmark")
+    parser.add_argument("--minutes", type=float, default=3.0)
+    parser.add_argument("--phrases", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    generator = AudioGenerator()
+    clip = synthetic_clip(args.minutes * 60, rng)
+
+    loop_time, loop_bounds = best_of(lambda: (find_audio_start(clip, SAMPLE_RATE), find_audio_end(clip, SAMPLE_RATE)), args.repeats)
+    vector_time, vector_bounds = best_of(lambda: generator._find_audio_bounds(clip, SAMPLE_RATE), args.repeats)
+    print(f"clip: {args.minutes:.1f} min ({len(clip)} samples)")
+    print(f"  loops:      {loop_time * 1000:9.2f} ms  bounds={loop_bounds}")
+    print(f"  vectorized: {vector_time * 1000:9.2f} ms  bounds={tuple(vector_bounds)}")
+    print(f"  speedup:    {loop_time / vector_time:9.1f}x")
+
+    phrases = [synthetic_clip(rng.uniform(0.8, 4.0), rng) for _ in range(args.phrases)]
+    mismatches = 0
+    loop_total = 0.0
+    vector_total = 0.0
+    for phrase in phrases:
+        start = time.perf_counter()
+        expected = (find_audio_start(phrase, SAMPLE_RATE), find_audio_end(phrase, SAMPLE_RATE))
+        loop_total += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = generator._find_audio_bounds(phrase, SAMPLE_RATE)
+        vector_total += time.perf_counter() - start
+        mismatches += tuple(actual) != expected
+    print(f"phrases: {len(phrases)}")
+    print(f"  loops:      {loop_total * 1000:9.2f} ms")
+    print(f"  vectorized: {vector_total * 1000:9.2f} ms")
+    print(f"  speedup:    {loop_total / vector_total:9.1f}x")
+    print(f"  mismatched boundaries: {mismatches + (tuple(vector_bounds) != loop_bounds)}")
+
+if __name__ == "__main__":
+    main()
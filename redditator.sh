@@ -42,26 +42,43 @@ is_container() {
 
 container_entrypoint() {
     log_step "starting redditator application in container"
-    
-    log_info "starting ollama service..."
-    ollama serve > /dev/null 2>&1 &
-    OLLAMA_PID=$!
-    
-    # wait for ollama to be ready 
-    until ollama ps > /dev/null 2>&1; do
-        sleep 1
-    done
-    
-    log_ok "ollama ready"
-    
+
+    OLLAMA_PID=""
+    case "${OLLAMA_HOST:-}" in
+        ""|*localhost*|*127.0.0.1*)
+            log_info "starting ollama service..."
+            ollama serve > /dev/null 2>&1 &
+            OLLAMA_PID=$!
+
+            # wait for ollama to be ready 
+            until ollama ps > /dev/null 2>&1; do
+                sleep 1
+            done
+
+            log_ok "ollama ready"
+            ;;
+        *)
+            # farm containers share one ollama service, and the coordinator never uses it
+            if [ "${REDDITATOR_ROLE:-}" != "coordinator" ]; then
+                log_info "waiting for ollama at $OLLAMA_HOST..."
+                until curl -sf "$OLLAMA_HOST/api/version" > /dev/null 2>&1; do
+                    sleep 1
+                done
+                log_ok "ollama ready"
+            fi
+            ;;
+    esac
+
     # run main application
-    log_step "starting python application"
-    cd /app && python3 src/main.py
+    log_step "starting python application${REDDITATOR_ROLE:+ as $REDDITATOR_ROLE}"
+    cd /app && python3 src/main.py "$@"
     
     # cleanup
     log_info "shutting down..."
-    kill $OLLAMA_PID 2>/dev/null || true
-    wait $OLLAMA_PID 2>/dev/null || true
+    if [ -n "$OLLAMA_PID" ]; then
+        kill $OLLAMA_PID 2>/dev/null || true
+        wait $OLLAMA_PID 2>/dev/null || true
+    fi
     log_ok "shutdown complete"
     exit 0
 }
@@ -193,14 +210,23 @@ host_mode() {
         echo "$current_hash" > "$BUILD_HASH_FILE"
     fi
 
+    if [[ "${1:-}" == "--farm" ]]; then
+        # --farm [workers] [prompts file]: coordinator, shared ollama and N workers on this host
+        workers="${2:-2}"
+        export FARM_PROMPTS="${3:-}"
+        log_step "starting render farm with $workers workers"
+        $DOCKER_COMPOSE -f "$COMPOSE_FILE" --profile farm up --scale worker="$workers" --exit-code-from coordinator ollama coordinator worker
+        exit $?
+    fi
+
     log_step "starting redditator container"
-    $DOCKER_COMPOSE -f "$COMPOSE_FILE" run --rm redditator
+    $DOCKER_COMPOSE -f "$COMPOSE_FILE" run --rm redditator "$@"
 }
 
 if is_container; then
     log_info "running in container mode"
     # in container, ignore all host logic and just run the app
-    container_entrypoint
+    container_entrypoint "$@"
 else
     host_mode "$@"
 fi
\ No newline at end of file
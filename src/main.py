@@ -1,11 +1,18 @@
 from pathlib import Path
 import shutil, subprocess
 import yaml
-import os, gc
+import os
+import argparse
 from utils.story import StoryGenerator
 from utils.audio import AudioGenerator
 from utils.video import VideoCreator
+from utils.pipeline import stream_story_to_speech
+from utils.prepare import prepare_backgrounds
+from utils.jobs import JobQueue, BatchRunner
+from utils.farm import Spool, WorkerQueue, Coordinator
 from utils.log import log
+from utils import models
+from utils.trace import tracer, profiled, trace_folder
 
 with open("config.yml") as f:
     cfg = yaml.safe_load(f)
@@ -15,24 +22,95 @@ class App:
         os.makedirs(config["paths"]["output_video"], exist_ok=True)
         os.makedirs(config["paths"]["video_backgrounds"], exist_ok=True)
         self.config = config
-        self.story_gen = StoryGenerator(config["config"]["ollama_model"])
-        self.audio_gen = AudioGenerator()
+        self.story_gen = StoryGenerator(
+            config["config"]["ollama_model"],
+            options=config["config"].get("ollama_options"),
+            cache_dir=config["paths"].get("prompt_cache"),
+            cache_max_mb=config["config"].get("prompt_cache_max_mb", 64),
+            cache_ttl_hours=config["config"].get("prompt_cache_ttl_hours", 168),
+            caption_after_chars=config["config"].get("caption_after_chars", 1200)
+        )
+        self.audio_gen = AudioGenerator(
+            batch_size=config["config"].get("tts_batch_size", 1),
+            workers=config["config"].get("tts_workers", 0),
+            worker_memory_mb=config["config"].get("tts_worker_memory_mb"),
+            cache_dir=config["paths"].get("tts_cache"),
+            cache_max_mb=config["config"].get("tts_cache_max_mb", 512),
+            buffer_dir=config["paths"].get("audio_buffer")
+        )
         self.video_gen = VideoCreator(config["paths"]["video_backgrounds"], config)
 
-    def run(self, prompt: str):
-        print("[debug] generating story...")
-        story = self.story_gen.generate(prompt)
-        audio_file, timestamps = self.audio_gen.speak(story)
-        video_file = self.video_gen.create_video(audio_file, timestamps)
-        del story
-        gc.collect()
+    def run(self, prompt: str, profiles=None):
+        _, audio, timestamps = self.speak(prompt)
+        video_files = self.render(audio, timestamps, profiles=profiles)
         log("")
-        
-        return video_file
+
+        return video_files
+
+    def speak(self, prompt: str):
+        print("[debug] generating story...")
+        with tracer.span("speech"):
+            if self.config["config"].get("stream_tts", False):
+                return stream_story_to_speech(self.story_gen, self.audio_gen, prompt)
+            story = self.story_gen.generate(prompt)
+            audio, timestamps = self.audio_gen.speak(story["story"])
+            return story, audio, timestamps
+
+    def render(self, audio, timestamps, output_name="final_video.mp4", profiles=None):
+        # one output path per encoder profile, the configured default when none are given
+        with tracer.span("render", output=output_name, profiles=profiles):
+            return self.video_gen.create_video(audio, timestamps, output_name, profiles)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prepare-backgrounds", action="store_true", help="transcode backgrounds to the output size and frame rate")
+    parser.add_argument("--force", action="store_true", help="with --prepare-backgrounds, redo clips that are already prepared")
+    parser.add_argument("--batch", nargs="?", const="", metavar="FILE", help="queue the prompts in FILE (one per line or JSON lines) and render every pending job")
+    parser.add_argument("--coordinator", nargs="?", const="", metavar="FILE", help="queue the prompts in FILE and hand every pending job to farm workers")
+    parser.add_argument("--retry-failed", action="store_true", help="with --batch or --coordinator, queue the jobs that failed earlier again")
+    parser.add_argument("--worker", action="store_true", help="render jobs handed out by a coordinator until it closes the queue")
+    parser.add_argument("--profile", action="append", dest="profiles", metavar="NAME", help="encoder profile from encoder_profiles; repeat to render several from one decode")
+    args = parser.parse_args()
+
     with open("config.yml") as f:
         cfg = yaml.safe_load(f)
+    if args.prepare_backgrounds:
+        prepare_backgrounds(cfg, force=args.force)
+        raise SystemExit(0)
+    farm = cfg.get("farm") or {}
+    if args.coordinator is not None:
+        # the coordinator only moves jobs around, it never loads a model
+        jobs = JobQueue(cfg["paths"].get("job_db", "./cache/jobs.db"))
+        if args.coordinator:
+            log(f"queued {jobs.enqueue_file(args.coordinator, args.profiles)} new jobs from {args.coordinator}")
+        if args.retry_failed:
+            log(f"retrying {jobs.requeue_failed()} failed jobs")
+        Coordinator(
+            jobs, Spool(farm.get("spool", "./cache/spool")),
+            queued_ahead=farm.get("queued_ahead", 2),
+            stale_seconds=farm.get("stale_seconds", 60),
+            status_seconds=farm.get("status_seconds", 30)
+        ).run()
+        raise SystemExit(0)
     app = App(cfg)
-    output = app.run(cfg["story_prompt"])
-    log("video saved at:", output)
\ No newline at end of file
+    try:
+        if args.worker:
+            spool = Spool(farm.get("spool", "./cache/spool"))
+            with WorkerQueue(spool, heartbeat_seconds=farm.get("heartbeat_seconds", 5)) as jobs, profiled(cfg, f"worker_{jobs.worker}", trace=False):
+                BatchRunner(app, jobs, trace_folder(cfg)).run()
+        elif args.batch is not None:
+            jobs = JobQueue(cfg["paths"].get("job_db", "./cache/jobs.db"))
+            if args.batch:
+                log(f"queued {jobs.enqueue_file(args.batch, args.profiles)} new jobs from {args.batch}")
+            if args.retry_failed:
+                log(f"retrying {jobs.requeue_failed()} failed jobs")
+            with profiled(cfg, "batch", trace=False):
+                BatchRunner(app, jobs, trace_folder(cfg)).run()
+        else:
+            with profiled(cfg, "run"):
+                outputs = app.run(cfg["story_prompt"], args.profiles)
+            log("video saved at:", *outputs)
+    finally:
+        app.audio_gen.close()
+        # the ollama pool only exists once a story was requested
+        models.unload("ollama")
\ No newline at end of file
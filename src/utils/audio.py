@@ -1,172 +1,510 @@
-import tempfile
-from TTS.api import TTS
 import numpy as np
 import wave
-import librosa, shutil
+import shutil
 import sys
+from contextlib import contextmanager
 from utils.log import log
+from utils.cache import DiskCache
+from utils import models
+from utils.trace import tracer
 import time
-import subprocess, string
-import os
+import string
+import os, zlib
+import collections, itertools
+import multiprocessing, resource
+from concurrent.futures import ProcessPoolExecutor
+import mmap, tempfile
 
 SAMPLE_RATE = 24000
+TTS_MODEL_NAME = "tts_models/en/vctk/vits"
+TRIM_FRAME_SECONDS = 0.01
+TRIM_THRESHOLD = 0.1
+TRIM_PADDING_SECONDS = 0.02
+# part of the cache key, bump whenever the stored samples change for the same text
+AUDIO_FORMAT = "peak-normalized"
 
-tts_model = TTS("tts_models/en/vctk/vits", gpu=False, progress_bar=False)
 tts_speaker = "p243"
 
+@contextmanager
+def _suppress_output():
+    stdout_backup = sys.stdout
+    stderr_backup = sys.stderr
+    sys.stdout = open(os.devnull, 'w')
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stderr.close()
+        sys.stdout = stdout_backup
+        sys.stderr = stderr_backup
+
+def _frame_rms(audio_data: np.ndarray, frame_length: int, hop_length: int):
+    # RMS of every frame starting at 0, hop, 2*hop, ... while a full frame
+    # still fits, computed from one running sum of squares
+    num_frames = max(0, -(-(len(audio_data) - frame_length) // hop_length))
+    if num_frames == 0:
+        return np.zeros(0, dtype=np.float64)
+    squares = np.square(audio_data, dtype=np.float64)
+    cumulative = np.concatenate(([0.0], np.cumsum(squares)))
+    starts = np.arange(num_frames) * hop_length
+    sums = cumulative[starts + frame_length] - cumulative[starts]
+    return np.sqrt(np.maximum(sums, 0.0) / frame_length)
+
+class VitsBackend:
+    def __init__(self, model_name=TTS_MODEL_NAME, speaker=tts_speaker):
+        from TTS.api import TTS
+        self.tts = TTS(model_name, gpu=False, progress_bar=False)
+        self.speaker = speaker
+
+    def synthesize(self, groups):
+        # runs the VITS model directly on a padded batch so the waveforms never
+        # touch the disk, per-item lengths come from the decoder mask
+        import torch, librosa
+        synthesizer = self.tts.synthesizer
+        model = synthesizer.tts_model
+        with _suppress_output():
+            token_ids = [model.tokenizer.text_to_ids(group) for group in groups]
+        results = [np.zeros(0, dtype=np.float32) for _ in groups]
+        batch = [i for i, ids in enumerate(token_ids) if ids]
+        if not batch:
+            return results
+
+        lengths = torch.tensor([len(token_ids[i]) for i in batch], dtype=torch.long)
+        inputs = torch.zeros(len(batch), int(lengths.max()), dtype=torch.long)
+        for row, i in enumerate(batch):
+            inputs[row, :len(token_ids[i])] = torch.tensor(token_ids[i], dtype=torch.long)
+        speaker_id = model.speaker_manager.name_to_id[self.speaker]
+        speaker_ids = torch.full((len(batch),), speaker_id, dtype=torch.long)
+
+        # VITS samples noise for durations and the flow, seeding from the text keeps a
+        # batch identical no matter which process synthesizes it
+        torch.manual_seed(zlib.crc32("\n".join(groups).encode("utf-8")))
+        with torch.no_grad(), _suppress_output():
+            outputs = model.inference(inputs, aux_input={"x_lengths": lengths, "speaker_ids": speaker_ids})
+
+        hop_length = model.config.audio.hop_length
+        num_samples = (outputs["y_mask"].sum(dim=(1, 2)).long() * hop_length).tolist()
+        waveforms = outputs["model_outputs"].squeeze(1).cpu().numpy().astype(np.float32)
+
+        source_rate = synthesizer.output_sample_rate
+        if source_rate != SAMPLE_RATE:
+            waveforms = librosa.resample(waveforms, orig_sr=source_rate, target_sr=SAMPLE_RATE, axis=-1)
+            num_samples = [int(round(n * SAMPLE_RATE / source_rate)) for n in num_samples]
+
+        for row, i in enumerate(batch):
+            results[i] = waveforms[row, :num_samples[row]]
+        return results
+
+models.register("tts", VitsBackend)
+
+_worker_generator = None
+
+def _init_worker(threads):
+    # an exception here breaks the executor, so the next result raises
+    # BrokenProcessPool instead of the workers being restarted forever
+    global _worker_generator
+    import torch
+    torch.set_num_threads(threads)
+    _worker_generator = AudioGenerator()
+    # load once per worker, not once per batch
+    models.get("tts")
+
+def _synthesize_in_worker(groups):
+    results, timings = _synthesize_timed(_worker_generator, groups)
+    # peak resident memory, the parent replaces the workers once it passes the limit
+    timings["rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results, timings
+
+def _synthesize_timed(generator, groups):
+    timings = {}
+    return generator._synthesize(groups, timings), timings
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class AudioTrack:
+    # mono int16 speech; renders feed it to ffmpeg over stdin, so the duration is known
+    # without probing and no wav has to be written. samples may live in a file mapping
+    def __init__(self, samples: np.ndarray, sample_rate: int = SAMPLE_RATE, mapping: mmap.mmap = None):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self._mapping = mapping
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    @property
+    def nbytes(self):
+        return self.samples.nbytes
+
+    def input_args(self):
+        return ["-f", "s16le", "-ar", str(self.sample_rate), "-ac", "1", "-i", "pipe:0"]
+
+    def _chunks(self, chunk_bytes=1 << 20):
+        data = memoryview(self.samples.astype("<i2", copy=False)).cast("B")
+        for offset in range(0, len(data), chunk_bytes):
+            yield data[offset:offset + chunk_bytes]
+            if self._mapping is not None and hasattr(mmap, "MADV_DONTNEED"):
+                # pages already handed on are dropped again, the file still has them
+                self._mapping.madvise(mmap.MADV_DONTNEED, offset, min(chunk_bytes, len(data) - offset))
+
+    def write_to(self, stream, chunk_bytes=1 << 20):
+        for chunk in self._chunks(chunk_bytes):
+            stream.write(chunk)
+
+    def save(self, path: str):
+        with wave.open(path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.sample_rate)
+            for chunk in self._chunks():
+                wav_file.writeframesraw(chunk)
+        return path
+
+class AudioBuffer:
+    # trimmed groups are appended to an unlinked temp file as they are produced and
+    # the finished track maps it back, so assembling a story never holds more than
+    # one group in memory however long it is
+    def __init__(self, folder: str = None, sample_rate: int = SAMPLE_RATE):
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="speech_", suffix=".pcm", dir=folder)
+        self._file = os.fdopen(fd, "w+b")
+        try:
+            # the open descriptor keeps the data, nothing is left behind if the run dies
+            os.unlink(path)
+        except OSError:
+            self._path = path
+        else:
+            self._path = None
+        self.sample_rate = sample_rate
+        self.length = 0
+
+    def append(self, samples: np.ndarray):
+        self._file.write(memoryview(np.ascontiguousarray(samples, dtype="<i2")).cast("B"))
+        self.length += len(samples)
+
+    def track(self) -> AudioTrack:
+        self._file.flush()
+        try:
+            if not self.length:
+                return AudioTrack(np.zeros(0, dtype=np.int16), self.sample_rate)
+            mapping = mmap.mmap(self._file.fileno(), self.length * 2, access=mmap.ACCESS_READ)
+            return AudioTrack(np.frombuffer(mapping, dtype="<i2"), self.sample_rate, mapping)
+        finally:
+            # the mapping holds its own reference to the file
+            self._file.close()
+            if self._path:
+                try:
+                    os.unlink(self._path)
+                except OSError:
+                    pass
+
 class AudioGenerator:
-    def __init__(self, pause_duration=0.25):
+    def __init__(self, pause_duration=0.25, batch_size=1, workers=0, worker_memory_mb=None,
+                 cache_dir=None, cache_max_mb=512, buffer_dir=None):
         self.pause_duration = float(pause_duration)
+        self.batch_size = max(1, int(batch_size))
+        self.workers = int(workers or 0)
+        self.worker_memory_mb = worker_memory_mb
+        self.cache = DiskCache(cache_dir, cache_max_mb * 1024 * 1024, suffix=".pcm") if cache_dir else None
+        # where the assembled speech is spooled, the system temp folder when unset
+        self.buffer_dir = buffer_dir
+        self._pool = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
     def speak(self, text: str):
         groups = self._split_into_groups(text)
-        print(f"[debug] generating TTS for {len(groups)} phrase groups")
-        temp_files = []
+        return self.speak_groups(groups, total=len(groups))
+
+    def speak_groups(self, groups, total=None, on_audio=None):
+        # groups may be any iterable, including one still being filled by the story stream
+        if total is not None:
+            print(f"[debug] generating TTS for {total} phrase groups")
+        buffer = AudioBuffer(self.buffer_dir)
         timestamps = []
         current_time = 0
         start_time = time.time()
-        group_size = 3
-        for i, group in enumerate(groups):
-            progress = (i + 1) / len(groups)
-            eta = self._calculate_eta(start_time, progress, len(groups))
-            self._print_progress(i, len(groups), f"'{group}'", eta)
-            group_audio_file = self._generate_and_trim_group_audio(group)
-            temp_files.append(group_audio_file)
-            duration = self._get_audio_duration(group_audio_file)
+        pause = np.zeros(int(SAMPLE_RATE * self.pause_duration), dtype=np.int16)
+        count = 0
+        for i, (group, audio) in enumerate(self._synthesize_groups(groups)):
+            count = i + 1
+            if total:
+                progress = (i + 1) / total
+                eta = self._calculate_eta(start_time, progress, total)
+                self._print_progress(i, total, f"'{group}'", eta)
+            else:
+                self._print_progress(i, None, f"'{group}'")
+            buffer.append(audio)
+            duration = len(audio) / SAMPLE_RATE
 
             if any(group.strip().endswith(p) for p in ".!?"):
-                silence_path = self._generate_silence(self.pause_duration)
-                temp_files.append(silence_path)
-                duration += self.pause_duration
-
-            words = group.split()
-            if words:
-                num_blocks = (len(words) + group_size - 1) // group_size
-                block_duration = duration / num_blocks
-                for b in range(num_blocks):
-                    start_idx = b * group_size
-                    end_idx = min((b + 1) * group_size, len(words))
-                    block_text = " ".join(words[start_idx:end_idx])
-                    timestamps.append({
-                        "text": block_text,
-                        "start": current_time + b * block_duration,
-                        "end": current_time + (b + 1) * block_duration
-                    })
+                buffer.append(pause)
+                duration += len(pause) / SAMPLE_RATE
 
+            word_bounds = self._align_words(audio, group.split())
+            timestamps.extend(self._block_timestamps(group, current_time, duration, word_bounds))
+            if on_audio:
+                on_audio(i, group, audio)
             current_time += duration
 
-        self._print_progress(len(groups), len(groups), "Complete!", "0s")
+        self._print_progress(count, count, "Complete!", "0s")
         log()
+        if self.cache:
+            log(f"tts cache: {self.cache.stats()}")
 
-        final_audio_file = self._concat_audio_files(temp_files)
+        with tracer.span("concat", groups=count) as args:
+            track = buffer.track()
+            args["audio_seconds"] = round(track.duration, 3)
 
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-
-        return final_audio_file, timestamps
+        return track, timestamps
 
     def _split_into_groups(self, text: str):
-        groups = []
+        return list(self._split_stream([text]))
+
+    def _split_stream(self, chunks):
+        # same grouping as splitting the full text, but emits each group as soon
+        # as its closing word has been followed by whitespace
+        buffer = ""
         current_group = []
-        for word in text.split():
-            current_group.append(word)
-            if any(word.endswith(p) for p in string.punctuation):
-                groups.append(' '.join(current_group))
-                current_group = []
+        for chunk in chunks:
+            buffer += chunk
+            words = buffer.split()
+            if words and not buffer[-1].isspace():
+                buffer = words.pop()
+            else:
+                buffer = ""
+            for word in words:
+                current_group.append(word)
+                if any(word.endswith(p) for p in string.punctuation):
+                    yield ' '.join(current_group)
+                    current_group = []
+        current_group.extend(buffer.split())
         if current_group:
-            groups.append(' '.join(current_group))
-        return groups
+            yield ' '.join(current_group)
 
+    def _block_timestamps(self, group: str, start: float, duration: float, word_bounds=None, group_size=3):
+        words = group.split()
+        if not words:
+            return []
+        if word_bounds is None:
+            step = duration / len(words)
+            word_times = [(start + i * step, start + (i + 1) * step) for i in range(len(words))]
+        else:
+            word_times = [(start + a / SAMPLE_RATE, start + b / SAMPLE_RATE) for a, b in word_bounds]
+        timestamps = []
+        num_blocks = (len(words) + group_size - 1) // group_size
+        for b in range(num_blocks):
+            start_idx = b * group_size
+            end_idx = min((b + 1) * group_size, len(words))
+            # blocks stay back to back, the last one holds until the group (and its pause) ends
+            block_end = word_times[end_idx][0] if end_idx < len(words) else start + duration
+            timestamps.append({
+                "text": " ".join(words[start_idx:end_idx]),
+                "start": word_times[start_idx][0] if b else start,
+                "end": block_end,
+                "words": [
+                    {"text": word, "start": word_start, "end": word_end}
+                    for word, (word_start, word_end) in zip(words[start_idx:end_idx], word_times[start_idx:end_idx])
+                ]
+            })
+        return timestamps
 
-    def _generate_and_trim_group_audio(self, group: str):
-        temp_wav = tempfile.NamedTemporaryFile(delete=False, dir="/tmp", suffix=".wav")
+    def _align_words(self, audio: np.ndarray, words: list, search_seconds=0.15):
+        # places each word boundary proportionally to the characters spoken so far,
+        # then snaps it to the quietest frame nearby, which is where VITS leaves
+        # the short gaps between words
+        if not words:
+            return []
+        if len(words) == 1 or len(audio) == 0:
+            return self._proportional_bounds(len(audio), words)
+        frame_length = int(TRIM_FRAME_SECONDS * SAMPLE_RATE)
+        hop_length = frame_length // 2
+        energy = _frame_rms(audio.astype(np.float32) / 32767, frame_length, hop_length)
+        if len(energy) < 2:
+            return self._proportional_bounds(len(audio), words)
 
-        stdout_backup = sys.stdout
-        stderr_backup = sys.stderr
-        sys.stdout = open(os.devnull, 'w')
-        sys.stderr = open(os.devnull, 'w')
+        expected = np.array([end for _, end in self._proportional_bounds(len(audio), words)[:-1]])
+        centers = (expected - frame_length // 2) // hop_length
+        radius = max(1, int(search_seconds * SAMPLE_RATE) // hop_length)
+        offsets = np.arange(-radius, radius + 1)
+        candidates = np.clip(centers[:, None] + offsets[None, :], 0, len(energy) - 1)
+        # prefer the candidate closest to the expected position among equally quiet frames
+        cost = energy[candidates] + 1e-9 * np.abs(offsets)[None, :]
+        chosen = candidates[np.arange(len(candidates)), np.argmin(cost, axis=1)]
+        # then move forward to the onset of the next word so captions do not lead the voice
+        loud = np.where(energy > np.max(energy) * TRIM_THRESHOLD, np.arange(len(energy)), len(energy))
+        next_loud = np.minimum.accumulate(loud[::-1])[::-1]
+        onsets = np.minimum(next_loud[chosen], chosen + radius)
+        boundaries = onsets * hop_length + frame_length // 2
+        boundaries = np.clip(np.maximum.accumulate(boundaries), 0, len(audio))
 
-        try:
-            tts_model.tts_to_file(text=group, speaker=tts_speaker, file_path=temp_wav.name)
-        finally:
-            sys.stdout.close()
-            sys.stderr.close()
-            sys.stdout = stdout_backup
-            sys.stderr = stderr_backup
-
-        audio_data, sr = librosa.load(temp_wav.name, sr=SAMPLE_RATE)
-        start_idx = self._find_audio_start(audio_data, sr)
-        end_idx = self._find_audio_end(audio_data, sr)
-        trimmed_audio = audio_data[start_idx:end_idx]
-        audio_int16 = (trimmed_audio * 32767).astype(np.int16)
-        with wave.open(temp_wav.name, 'wb') as wav_file:
-            wav_file.setnchannels(1)
-            wav_file.setsampwidth(2)
-            wav_file.setframerate(SAMPLE_RATE)
-            wav_file.writeframes(audio_int16.tobytes())
-        return temp_wav.name
+        edges = np.concatenate(([0], boundaries, [len(audio)])).astype(int)
+        return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
 
+    def _proportional_bounds(self, num_samples: int, words: list):
+        weights = np.array([len(word) + 1 for word in words], dtype=np.float64)
+        edges = np.round(np.concatenate(([0.0], np.cumsum(weights))) / weights.sum() * num_samples).astype(int)
+        return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
 
-    def _generate_silence(self, duration: float):
-        samples = int(SAMPLE_RATE * duration)
-        silence = np.zeros(samples, dtype=np.int16)
-        temp_wav = tempfile.NamedTemporaryFile(delete=False, dir="/tmp", suffix=".wav")
-        with wave.open(temp_wav.name, 'wb') as wav_file:
-            wav_file.setnchannels(1)
-            wav_file.setsampwidth(2)
-            wav_file.setframerate(SAMPLE_RATE)
-            wav_file.writeframes(silence.tobytes())
-        return temp_wav.name
+    def _synthesize_groups(self, groups):
+        # yields (group, audio) in input order; groups are looked up in the cache and
+        # synthesized batch_size at a time as they arrive
+        pending = collections.deque()
+        # with workers, windows are read ahead of the results; a phrase already submitted
+        # in an earlier batch is not in the cache yet, so later windows take its audio from
+        # that batch instead of synthesizing it again, as a serial run would hit the cache
+        in_flight = set()
+        waiting = collections.Counter()
+        held = {}
 
-    def _find_audio_start(self, audio_data: np.ndarray, sr: int):
-        frame_length = int(0.01 * sr)
-        hop_length = frame_length // 2
-        energy = []
-        for i in range(0, len(audio_data) - frame_length, hop_length):
-            frame = audio_data[i:i + frame_length]
-            energy.append(np.sqrt(np.mean(frame**2)))
-        energy = np.array(energy)
-        threshold = np.max(energy) * 0.1
-        for i, e in enumerate(energy):
-            if e > threshold:
-                return max(0, i * hop_length - int(0.02 * sr))
-        return 0
-
-    def _find_audio_end(self, audio_data: np.ndarray, sr: int):
-        frame_length = int(0.01 * sr)
+        def batches():
+            for window in _batched(groups, self.batch_size):
+                keys = [self._cache_key(group) if self.cache else group for group in window]
+                missing = {}
+                reused = set()
+                for group, key in zip(window, keys):
+                    if key in missing or key in reused:
+                        continue
+                    if self.cache and key in in_flight:
+                        reused.add(key)
+                        waiting[key] += 1
+                    elif not self.cache or key not in self.cache:
+                        missing[key] = group
+                in_flight.update(missing)
+                pending.append((window, keys, list(missing), reused))
+                yield list(missing.values())
+
+        for fresh, timings in self._map_batches(batches()):
+            window, keys, missing, reused = pending.popleft()
+            if fresh:
+                # timings come back from whichever process ran the batch
+                audio_seconds = sum(len(audio) for audio in fresh) / SAMPLE_RATE
+                tracer.complete(
+                    "tts_model", timings["model"], groups=len(fresh), audio_seconds=round(audio_seconds, 3),
+                    rtf=round(timings["model"] / audio_seconds, 4) if audio_seconds else None
+                )
+                tracer.complete("trim", timings["trim"], groups=len(fresh))
+                tracer.counter("tts_rtf", rtf=timings["model"] / audio_seconds if audio_seconds else 0)
+            produced = dict(zip(missing, fresh))
+            in_flight.difference_update(missing)
+            for key in missing:
+                if waiting[key]:
+                    held[key] = produced[key]
+            for key in reused:
+                produced[key] = held[key]
+                waiting[key] -= 1
+                if not waiting[key]:
+                    del waiting[key], held[key]
+            for group, key in zip(window, keys):
+                audio = produced.get(key)
+                if audio is None:
+                    data = self.cache.get(key) if self.cache else None
+                    if data is None:
+                        # evicted since the lookup
+                        audio = self._synthesize([group])[0]
+                        self.cache.put(key, audio.tobytes())
+                    else:
+                        audio = np.frombuffer(data, dtype=np.int16)
+                elif key in reused:
+                    self.cache.hits += 1
+                elif self.cache and key not in self.cache:
+                    self.cache.misses += 1
+                    self.cache.put(key, audio.tobytes())
+                yield group, audio
+
+    def _cache_key(self, group: str):
+        return DiskCache.key(
+            group, tts_speaker, TTS_MODEL_NAME, SAMPLE_RATE,
+            TRIM_FRAME_SECONDS, TRIM_THRESHOLD, TRIM_PADDING_SECONDS, AUDIO_FORMAT
+        )
+
+    def _map_batches(self, batches):
+        if self.workers > 1:
+            return self._map_in_workers(batches)
+        return (_synthesize_timed(self, batch) for batch in batches)
+
+    def _map_in_workers(self, batches, queued_per_worker=2):
+        # results are handed back in submission order, so the story order and
+        # therefore the timestamps match a serial run
+        submitted = collections.deque()
+        batches = iter(batches)
+        exhausted = False
+        while True:
+            while not exhausted and len(submitted) < self.workers * queued_per_worker:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                pool = self._get_pool()
+                submitted.append((pool, pool.submit(_synthesize_in_worker, batch)))
+            if not submitted:
+                return
+            pool, future = submitted.popleft()
+            results, timings = future.result()
+            # ru_maxrss only grows, so a worker past the limit stays past it; the
+            # pool is replaced once, batches already submitted finish on the old one
+            if self.worker_memory_mb and timings["rss_mb"] > self.worker_memory_mb and pool is self._pool:
+                log(f"TTS worker at {timings['rss_mb']:.0f} MB, over {self.worker_memory_mb} MB, restarting the workers")
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            yield results, timings
+
+    def _get_pool(self):
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            log(f"starting {self.workers} TTS workers ({threads} threads each)")
+            self._pool = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,)
+            )
+        return self._pool
+
+    def _synthesize(self, groups, timings=None):
+        if not groups:
+            return []
+        started = time.perf_counter()
+        waveforms = models.get("tts").synthesize(groups)
+        synthesized = time.perf_counter()
+        results = []
+        for audio_data in waveforms:
+            start_idx, end_idx = self._find_audio_bounds(audio_data, SAMPLE_RATE)
+            # scaled to full range by the phrase peak like Coqui's save_wav, so phrases
+            # are as loud as the wav files tts_to_file used to write
+            peak = max(0.01, float(np.max(np.abs(audio_data)))) if len(audio_data) else 1.0
+            trimmed_audio = np.clip(audio_data[start_idx:end_idx] / peak, -1.0, 1.0)
+            results.append((trimmed_audio * 32767).astype(np.int16))
+        if timings is not None:
+            timings["model"] = synthesized - started
+            timings["trim"] = time.perf_counter() - synthesized
+        return results
+
+    def _find_audio_bounds(self, audio_data: np.ndarray, sr: int):
+        frame_length = int(TRIM_FRAME_SECONDS * sr)
         hop_length = frame_length // 2
-        energy = []
-        for i in range(0, len(audio_data) - frame_length, hop_length):
-            frame = audio_data[i:i + frame_length]
-            energy.append(np.sqrt(np.mean(frame**2)))
-        energy = np.array(energy)
-        threshold = np.max(energy) * 0.1
-        for i in range(len(energy) - 1, -1, -1):
-            if energy[i] > threshold:
-                return min(len(audio_data), (i + 1) * hop_length + int(0.02 * sr))
-        return len(audio_data)
-
-    def _get_audio_duration(self, audio_file: str):
-        result = subprocess.run([
-            "ffprobe","-v","error","-show_entries","format=duration",
-            "-of","default=noprint_wrappers=1:nokey=1",audio_file
-        ], capture_output=True, text=True)
-        return float(result.stdout.strip())
-
-    def _concat_audio_files(self, audio_files):
-        concat_list = tempfile.NamedTemporaryFile(delete=False, dir="/tmp", suffix=".txt", mode='w')
-        for audio_file in audio_files:
-            concat_list.write(f"file '{os.path.abspath(audio_file)}'\n")
-        concat_list.close()
-        output_file = tempfile.NamedTemporaryFile(delete=False, dir="/tmp", suffix=".wav")
-        output_file.close()
-        subprocess.run([
-            "ffmpeg","-y","-f","concat","-safe","0",
-            "-i",concat_list.name,"-c","copy",output_file.name
-        ], capture_output=True)
-        os.remove(concat_list.name)
-        return output_file.name
+        padding = int(TRIM_PADDING_SECONDS * sr)
+        energy = _frame_rms(audio_data, frame_length, hop_length)
+        if len(energy) == 0:
+            return 0, len(audio_data)
+        loud = np.flatnonzero(energy > np.max(energy) * TRIM_THRESHOLD)
+        if len(loud) == 0:
+            return 0, len(audio_data)
+        start = max(0, int(loud[0]) * hop_length - padding)
+        end = min(len(audio_data), (int(loud[-1]) + 1) * hop_length + padding)
+        return start, end
 
     def _print_progress(self, current, total, status="", eta=""):
         try:
@@ -176,12 +514,16 @@ class AudioGenerator:
         min_bar_length = 20
         max_bar_length = terminal_width - 60
         bar_length = max(min_bar_length, min(max_bar_length, 40))
-        progress = float(current) / float(total) if total > 0 else 0
+        progress = float(current) / float(total) if total else 0
         block = int(round(bar_length * progress))
         percent = round(progress * 100, 1)
         color_start = "\033[92m"
         color_end = "\033[0m"
         bar = f"{color_start}{'█' * block}{color_end}{'░' * (bar_length - block)}"
+        if total is None:
+            # streaming, the number of groups is not known yet
+            percent = "--"
+            total = "?"
         status_text = f"{percent}% ({current}/{total}) {status}"
         if eta:
             status_text += f" | {eta}"
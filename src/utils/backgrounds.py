@@ -0,0 +1,124 @@
+import os, json, time, random, threading
+from utils.files import write_json, locked
+
+class BackgroundHistory:
+    # footage used by the last few renders, shared by every process that renders from
+    # the same folder; clips are keyed by name without extension, so a prepared copy
+    # and its original count as the same footage. Records from different processes
+    # are serialized by a file lock, the thread lock covers threads of this one
+    def __init__(self, path: str = None, renders: int = 20):
+        self.path = path
+        self.renders = renders
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def footage(path: str):
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def _load(self):
+        if not self.path:
+            return []
+        try:
+            with open(self.path) as f:
+                return json.load(f).get("renders", [])
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def recent(self):
+        # footage name -> [(start, end), ...] in seconds of that clip
+        used = {}
+        with self._lock:
+            renders = self._load()
+        for render in renders:
+            for name, start, end in render["ranges"]:
+                used.setdefault(name, []).append((start, end))
+        return used
+
+    def record(self, plan):
+        if not self.path:
+            return
+        ranges = [[self.footage(entry["path"]), entry["inpoint"], entry["outpoint"]] for entry in plan]
+        with self._lock, locked(self.path):
+            renders = (self._load() + [{"time": time.time(), "ranges": ranges}])[-self.renders:]
+            write_json(self.path, {"renders": renders})
+
+def _overlap(start: float, end: float, ranges):
+    return sum(max(0.0, min(end, b) - max(start, a)) for a, b in ranges)
+
+class BackgroundScheduler:
+    # picks which footage covers a render: every piece starts on a keyframe, so the
+    # concat demuxer seeks straight to it instead of decoding from the clip start, as
+    # few pieces as possible are used, and footage from recent renders is avoided
+    def __init__(self, history: BackgroundHistory = None, rng: random.Random = None, min_piece_seconds=2.0):
+        self.history = history or BackgroundHistory()
+        self.rng = rng or random.Random()
+        self.min_piece_seconds = min_piece_seconds
+
+    def plan(self, clips, duration: float):
+        used = self.history.recent()
+        plan = []
+        current = 0.0
+        while current < duration - 1e-3:
+            needed = duration - current
+            clip, inpoint, length = self._pick(clips, needed, used)
+            name = BackgroundHistory.footage(clip["path"])
+            used.setdefault(name, []).append((inpoint, inpoint + length))
+            plan.append({
+                "path": os.path.abspath(clip["path"]),
+                "inpoint": inpoint,
+                "outpoint": inpoint + length,
+                "start": current,
+                "keyframes": clip.get("keyframes", [0.0])
+            })
+            current += length
+        self.history.record(plan)
+        return plan
+
+    def _pick(self, clips, needed: float, used: dict):
+        candidates = []
+        for clip in clips:
+            ranges = used.get(BackgroundHistory.footage(clip["path"]), [])
+            for keyframe in clip.get("keyframes") or [0.0]:
+                length = min(clip["duration"] - keyframe, needed)
+                # a short tail of a clip is only worth a file switch when nothing longer is left
+                if length <= 0 or (length < min(self.min_piece_seconds, needed) and keyframe > 0):
+                    continue
+                candidates.append((_overlap(keyframe, keyframe + length, ranges) / length, length, clip, keyframe))
+
+        # least reused footage first, then one piece that covers everything that is left,
+        # else one of the longest, so the render opens as few files as possible
+        freshest = min(candidate[0] for candidate in candidates)
+        fresh = [candidate for candidate in candidates if candidate[0] <= freshest + 0.05]
+        covering = [candidate for candidate in fresh if candidate[1] >= needed - 1e-6]
+        if not covering:
+            longest = max(candidate[1] for candidate in fresh)
+            covering = [candidate for candidate in fresh if candidate[1] >= longest * 0.9]
+        _, length, clip, keyframe = self.rng.choice(covering)
+        return clip, keyframe, length
+
+def sequential_plan(clips, duration: float):
+    # every clip from its first frame, in folder order
+    plan = []
+    current = 0.0
+    i = 0
+    while current < duration:
+        source = clips[i % len(clips)]
+        time_needed = min(source["duration"], duration - current)
+        plan.append({
+            "path": os.path.abspath(source["path"]),
+            "inpoint": 0.0,
+            "outpoint": time_needed,
+            "start": current,
+            "keyframes": source.get("keyframes", [0.0])
+        })
+        current += time_needed
+        i += 1
+    return plan
+
+def write_concat_list(plan, concat_file: str):
+    with open(concat_file, "w") as f:
+        for entry in plan:
+            f.write(f"file '{entry['path']}'\n")
+            f.write(f"inpoint {entry['inpoint']}\n")
+            f.write(f"outpoint {entry['outpoint']}\n")
+            f.write(f"duration {entry['outpoint'] - entry['inpoint']}\n")
@@ -0,0 +1,87 @@
+import os, json, hashlib, time
+from utils.log import log
+from utils.files import write_atomic
+
+class DiskCache:
+    def __init__(self, folder: str, max_bytes: int, suffix=".bin", max_age=None):
+        self.folder = folder
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+        # seconds since the write after which an entry counts as a miss
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.folder, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path(self, key: str):
+        return os.path.join(self.folder, key[:2], key + self.suffix)
+
+    def __contains__(self, key: str):
+        return os.path.exists(self.path(key))
+
+    def get(self, key: str):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # atime tracks recency for eviction, mtime keeps the write time
+        stat = os.stat(path)
+        if self.max_age is not None and time.time() - stat.st_mtime > self.max_age:
+            try:
+                os.remove(path)
+                self._size -= stat.st_size
+            except FileNotFoundError:
+                pass
+            self.misses += 1
+            return None
+        os.utime(path, (time.time(), stat.st_mtime))
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self.path(key)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        write_atomic(path, data)
+        self._size += len(data) - previous
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def stats(self):
+        return f"{self.hits} hits, {self.misses} misses, {self._size / 1024 / 1024:.1f}MB"
+
+    def _entries(self):
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_atime
+
+    def _evict(self):
+        # least recently used first, down to 90% so we do not rescan on every put
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for path, size, _ in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            removed += 1
+        log(f"cache {self.folder}: evicted {removed} entries")
@@ -0,0 +1,76 @@
+import subprocess, threading
+from utils.log import log
+
+# what a profile falls back to for every key it leaves out (the old hard-coded settings)
+DEFAULT_PROFILE = {
+    "codec": "libx264",
+    "preset": "ultrafast",
+    "crf": 28,
+    "audio_codec": "aac",
+    "audio_bitrate": "192k"
+}
+
+_encoders = None
+_lock = threading.Lock()
+
+def available_encoders():
+    # names from `ffmpeg -encoders`, read once per process; empty if ffmpeg cannot list them
+    global _encoders
+    with _lock:
+        if _encoders is None:
+            try:
+                output = subprocess.run(
+                    ["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, check=True
+                ).stdout
+            except (OSError, subprocess.CalledProcessError):
+                output = ""
+            _encoders = {
+                fields[1] for fields in (line.split() for line in output.splitlines())
+                if len(fields) > 1 and len(fields[0]) == 6 and fields[0][0] in "VAS"
+            }
+        return _encoders
+
+def resolve_profile(config: dict, name: str = None) -> dict:
+    # a profile whose codec this ffmpeg lacks is replaced by its `fallback`
+    profiles = config.get("encoder_profiles") or {}
+    requested = name = name or config["config"].get("encoder_profile", "default")
+    seen = []
+    while True:
+        if name not in profiles and name != "default":
+            raise ValueError(f"unknown encoder profile: {name}")
+        profile = {**DEFAULT_PROFILE, **(profiles.get(name) or {})}
+        encoders = available_encoders()
+        if not encoders or profile["codec"] in encoders:
+            break
+        seen.append(name)
+        fallback = profile.get("fallback")
+        if not fallback or fallback in seen:
+            raise ValueError(f"encoder profile '{name}' needs {profile['codec']}, which this ffmpeg does not have")
+        log(f"{profile['codec']} is not available, rendering '{requested}' with profile '{fallback}'")
+        name = fallback
+
+    resolution = str(profile.get("resolution") or config["config"]["video_resolution"])
+    profile["width"], profile["height"] = map(int, resolution.split("x"))
+    profile["fps"] = int(profile.get("fps") or config["config"].get("video_fps", 60))
+    # outputs are named after the profile that was asked for, even after a fallback
+    profile["name"] = requested
+    return profile
+
+def video_codec_args(profile: dict):
+    args = ["-c:v", profile["codec"]]
+    if profile.get("preset") is not None:
+        args += ["-preset", str(profile["preset"])]
+    if profile.get("crf") is not None:
+        args += ["-crf", str(profile["crf"])]
+    return args + [str(arg) for arg in profile.get("params") or []]
+
+def audio_codec_args(profile: dict):
+    return ["-c:a", profile["audio_codec"], "-b:a", str(profile["audio_bitrate"])]
+
+def container_args(profile: dict):
+    args = []
+    if profile.get("tag"):
+        args += ["-tag:v", profile["tag"]]
+    if profile.get("faststart"):
+        args += ["-movflags", "+faststart"]
+    return args
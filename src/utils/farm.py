@@ -0,0 +1,266 @@
+import os, json, time, socket, threading
+from utils.log import log
+from utils.files import write_json
+
+STATES = ("pending", "running", "done", "failed", "workers")
+
+def _read_json(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _job_id(name: str) -> int:
+    return int(name.split(".", 1)[0])
+
+class Spool:
+    # a folder shared by the coordinator and every worker; a job is one json file and
+    # its state is the subfolder it sits in. Claiming is a rename, which only one
+    # worker can win, so nothing but a shared filesystem is needed
+    def __init__(self, folder: str):
+        self.folder = folder
+        for state in STATES:
+            os.makedirs(os.path.join(folder, state), exist_ok=True)
+
+    def path(self, state: str, name: str = ""):
+        return os.path.join(self.folder, state, name)
+
+    def names(self, state: str):
+        return sorted(name for name in os.listdir(self.path(state)) if name.endswith(".json"))
+
+    def closed_at(self):
+        try:
+            return os.stat(os.path.join(self.folder, "closed")).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def open(self):
+        try:
+            os.remove(os.path.join(self.folder, "closed"))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        # idle workers exit once the queue is closed and empty
+        open(os.path.join(self.folder, "closed"), "w").close()
+
+    def submit(self, job: dict):
+        write_json(self.path("pending", f"{job['id']:08d}.json"), job)
+
+    def pending(self):
+        return len(self.names("pending"))
+
+    def contains(self, job_id: int):
+        return any(_job_id(name) == job_id for state in ("pending", "running") for name in self.names(state))
+
+    def discard(self, job_id: int):
+        # a job that was requeued but then finished by its first worker must not run again
+        for state in ("pending", "running"):
+            for name in self.names(state):
+                if _job_id(name) == job_id:
+                    try:
+                        os.remove(self.path(state, name))
+                    except FileNotFoundError:
+                        pass
+
+    def collect(self):
+        # finished and failed results, each handed out once
+        results = []
+        for state in ("done", "failed"):
+            for name in self.names(state):
+                result = _read_json(self.path(state, name))
+                os.remove(self.path(state, name))
+                if result is not None:
+                    results.append((state, result))
+        return results
+
+    def requeue_stale(self, stale_seconds: float):
+        # running files are touched by their worker's heartbeat; one that stopped being
+        # touched belongs to a worker that died, so the job goes back to pending
+        requeued = []
+        now = time.time()
+        for name in self.names("running"):
+            path = self.path("running", name)
+            try:
+                if now - os.stat(path).st_mtime <= stale_seconds:
+                    continue
+                os.rename(path, self.path("pending", f"{_job_id(name):08d}.json"))
+            except FileNotFoundError:
+                continue
+            requeued.append(_job_id(name))
+        return requeued
+
+    def workers(self, stale_seconds: float):
+        # live workers; the heartbeat of one that went silent is removed with its jobs requeued
+        workers = []
+        now = time.time()
+        for name in self.names("workers"):
+            worker = _read_json(self.path("workers", name))
+            if worker and now - worker["updated"] <= stale_seconds:
+                workers.append(worker)
+                continue
+            try:
+                os.remove(self.path("workers", name))
+            except FileNotFoundError:
+                pass
+        return workers
+
+class WorkerQueue:
+    # the JobQueue interface BatchRunner works against, backed by a spool; claim() waits
+    # for work until the coordinator closes the queue
+    def __init__(self, spool: Spool, heartbeat_seconds=5, poll_seconds=1):
+        self.spool = spool
+        self.worker = f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self._owned = {}
+        self._stages = {}
+        self._counts = {"done": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = time.time()
+
+    def __enter__(self):
+        self._beat()
+        self._thread = threading.Thread(target=self._heartbeat, name="heartbeat", daemon=True)
+        self._thread.start()
+        log(f"worker {self.worker} waiting for jobs in {self.spool.folder}")
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        try:
+            os.remove(self.spool.path("workers", f"{self.worker}.json"))
+        except FileNotFoundError:
+            pass
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            self._beat()
+
+    def _beat(self):
+        with self._lock:
+            owned = dict(self._owned)
+            stages = dict(self._stages)
+            counts = dict(self._counts)
+        for path in owned.values():
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        write_json(self.spool.path("workers", f"{self.worker}.json"), {
+            "worker": self.worker,
+            "jobs": stages,
+            **counts,
+            "updated": time.time()
+        })
+
+    def requeue_interrupted(self):
+        # a crashed worker's jobs come back through the coordinator's stale check
+        return 0
+
+    def claim(self):
+        while True:
+            for name in self.spool.names("pending"):
+                job_id = _job_id(name)
+                path = self.spool.path("running", f"{job_id:08d}.{self.worker}.json")
+                try:
+                    os.rename(self.spool.path("pending", name), path)
+                    # the rename keeps the time it was queued, the stale check needs the claim
+                    os.utime(path)
+                except FileNotFoundError:
+                    # another worker was faster
+                    continue
+                job = _read_json(path)
+                if job is None:
+                    continue
+                with self._lock:
+                    self._owned[job_id] = path
+                    self._stages[job_id] = "claimed"
+                return job
+            # a marker left by an earlier farm does not stop a worker that started after it
+            closed = self.spool.closed_at()
+            if closed is not None and closed >= self._started:
+                return None
+            time.sleep(self.poll_seconds)
+
+    def stage(self, job_id: int, stage: str):
+        with self._lock:
+            self._stages[job_id] = stage
+
+    def _report(self, state: str, job_id: int, result: dict):
+        write_json(self.spool.path(state, f"{job_id:08d}.json"), {"id": job_id, "worker": self.worker, **result})
+        with self._lock:
+            path = self._owned.pop(job_id, None)
+            self._stages.pop(job_id, None)
+            self._counts[state] += 1
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def finish(self, job_id: int, output: str, timings: dict):
+        self._report("done", job_id, {"output": output, "timings": timings})
+
+    def fail(self, job_id: int, error: str, timings: dict):
+        self._report("failed", job_id, {"error": error, "timings": timings})
+
+    def counts(self):
+        with self._lock:
+            return dict(self._counts)
+
+class Coordinator:
+    # feeds jobs from the JobQueue database into the spool a few at a time, records
+    # what workers report back and requeues the jobs of workers that went silent
+    def __init__(self, jobs, spool: Spool, queued_ahead=2, stale_seconds=60, poll_seconds=1, status_seconds=30):
+        self.jobs = jobs
+        self.spool = spool
+        self.queued_ahead = queued_ahead
+        self.stale_seconds = stale_seconds
+        self.poll_seconds = poll_seconds
+        self.status_seconds = status_seconds
+
+    def run(self):
+        self.spool.open()
+        # jobs handed out by an earlier coordinator that are no longer in the spool
+        lost = [job_id for job_id in self.jobs.running() if not self.spool.contains(job_id)]
+        if lost:
+            self.jobs.requeue(lost)
+            log(f"requeued {len(lost)} jobs lost from the spool")
+        last_status = 0
+        try:
+            while True:
+                for state, result in self.spool.collect():
+                    timings = {**(result.get("timings") or {}), "worker": result["worker"]}
+                    self.spool.discard(result["id"])
+                    if state == "done":
+                        self.jobs.finish(result["id"], result["output"], timings)
+                        log(f"job {result['id']}: done by {result['worker']} in {timings.get('total', 0):.1f}s")
+                    else:
+                        self.jobs.fail(result["id"], result["error"], timings)
+                        log(f"job {result['id']}: failed on {result['worker']}: {result['error']}")
+                for job_id in self.spool.requeue_stale(self.stale_seconds):
+                    log(f"job {job_id}: worker stopped sending heartbeats, requeued")
+
+                workers = self.spool.workers(self.stale_seconds)
+                while self.spool.pending() < self.queued_ahead * max(1, len(workers)):
+                    job = self.jobs.claim()
+                    if job is None:
+                        break
+                    self.spool.submit(job)
+
+                counts = self.jobs.counts()
+                if not counts.get("pending") and not counts.get("running"):
+                    break
+                if time.time() - last_status >= self.status_seconds:
+                    last_status = time.time()
+                    busy = ", ".join(f"{worker['worker']} {worker['jobs']}" for worker in workers) or "none"
+                    log(f"farm: {counts}, {self.spool.pending()} queued, workers: {busy}")
+                time.sleep(self.poll_seconds)
+        finally:
+            self.spool.close()
+        log(f"farm finished: {self.jobs.counts()}")
@@ -0,0 +1,35 @@
+import os, json, fcntl, tempfile
+from contextlib import contextmanager
+
+def write_atomic(path: str, data: bytes):
+    # written next to the target and renamed over it, so readers in other threads,
+    # processes or nodes on a shared folder only ever see a complete file
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def write_json(path: str, data):
+    write_atomic(path, json.dumps(data).encode("utf-8"))
+
+@contextmanager
+def locked(path: str):
+    # an exclusive lock shared by every process that uses the same path; it is taken
+    # on a separate lock file because the file itself is replaced on every write
+    lock_path = path + ".lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,214 @@
+import os, json, time, sqlite3, threading, hashlib, queue
+from utils.log import log
+from utils.trace import tracer
+
+class JobQueue:
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE,
+                prompt TEXT NOT NULL,
+                output TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                timings TEXT,
+                created REAL,
+                started REAL,
+                finished REAL
+            )
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "profiles" not in columns:
+            # encoder profiles were added later; older queues get the column on open
+            self._db.execute("ALTER TABLE jobs ADD COLUMN profiles TEXT")
+
+    def enqueue(self, prompt: str, output: str = None, key: str = None, profiles=None):
+        # the key makes re-submitting the same batch file a no-op, so it can be resumed
+        if isinstance(profiles, str):
+            profiles = [name.strip() for name in profiles.split(",") if name.strip()]
+        key = key or hashlib.sha256(f"{prompt}\n{output or ''}".encode("utf-8")).hexdigest()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO jobs (key, prompt, output, profiles, created) VALUES (?, ?, ?, ?, ?)",
+                (key, prompt, output, json.dumps(profiles) if profiles else None, time.time())
+            )
+        return cursor.rowcount > 0
+
+    def enqueue_file(self, path: str, profiles=None):
+        # profiles apply to every line that does not name its own
+        added = 0
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    job = json.loads(line)
+                    added += self.enqueue(job["prompt"], job.get("output"), job.get("id"), job.get("profiles") or profiles)
+                else:
+                    added += self.enqueue(line, key=f"{os.path.abspath(path)}:{number}:{line}", profiles=profiles)
+        return added
+
+    def requeue_interrupted(self):
+        with self._lock:
+            return self._db.execute("UPDATE jobs SET status = 'pending', started = NULL WHERE status = 'running'").rowcount
+
+    def requeue_failed(self):
+        # failures are often transient (ollama down, disk full), so they can be run again
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'pending', started = NULL, finished = NULL WHERE status = 'failed'"
+            ).rowcount
+
+    def running(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT id FROM jobs WHERE status = 'running'")]
+
+    def requeue(self, job_ids):
+        with self._lock:
+            self._db.executemany("UPDATE jobs SET status = 'pending', started = NULL WHERE id = ?", [(job_id,) for job_id in job_ids])
+
+    def claim(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, prompt, output, profiles FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                self._db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?", (time.time(), row[0]))
+            finally:
+                self._db.execute("COMMIT")
+        return {"id": row[0], "prompt": row[1], "output": row[2], "profiles": json.loads(row[3]) if row[3] else None}
+
+    def finish(self, job_id: int, output: str, timings: dict):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'done', output = ?, timings = ?, finished = ?, error = NULL WHERE id = ?",
+                (output, json.dumps(timings), time.time(), job_id)
+            )
+
+    def fail(self, job_id: int, error: str, timings: dict):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, timings = ?, finished = ? WHERE id = ?",
+                (error, json.dumps(timings), time.time(), job_id)
+            )
+
+    def counts(self):
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+class BatchRunner:
+    # story + TTS for the next job runs on the calling thread while the previous
+    # job encodes on a video thread; the next job is only claimed once the video
+    # thread has taken the previous one, so the speech stage is never more than one
+    # story ahead and no claimed job sits waiting that another worker could run
+    def __init__(self, app, jobs: JobQueue, trace_folder: str = None):
+        self.app = app
+        self.jobs = jobs
+        self.trace_folder = trace_folder
+        self._ready = queue.Queue(maxsize=1)
+        self._ahead = threading.Semaphore(1)
+        # tracer.mark() at each open job's claim
+        self._trace_starts = {}
+        self._trace_lock = threading.Lock()
+
+    def run(self):
+        requeued = self.jobs.requeue_interrupted()
+        if requeued:
+            log(f"resuming {requeued} interrupted jobs")
+        if self.trace_folder:
+            tracer.enable()
+        video_thread = threading.Thread(target=self._video_stage, daemon=True)
+        video_thread.start()
+        try:
+            while True:
+                self._ahead.acquire()
+                job = self.jobs.claim()
+                if job is None:
+                    break
+                with self._trace_lock:
+                    self._trace_starts[job["id"]] = tracer.mark()
+                log(f"job {job['id']}: generating story and speech")
+                self._stage(job["id"], "speech")
+                timings = {"claimed": time.time()}
+                started = time.perf_counter()
+                try:
+                    _, audio, timestamps = self.app.speak(job["prompt"])
+                except Exception as e:
+                    timings["speech"] = time.perf_counter() - started
+                    log(f"job {job['id']} failed: {e}")
+                    self.jobs.fail(job["id"], str(e), timings)
+                    self._write_trace(job["id"])
+                    self._ahead.release()
+                    continue
+                timings["speech"] = time.perf_counter() - started
+                self._stage(job["id"], "waiting for video")
+                self._ready.put((job, audio, timestamps, timings))
+        finally:
+            self._ready.put(None)
+            video_thread.join()
+            if self.trace_folder:
+                tracer.enabled = False
+        log(f"batch finished: {self.jobs.counts()}")
+
+    def _stage(self, job_id: int, stage: str):
+        # only a farm worker has anyone to report the current stage to
+        report = getattr(self.jobs, "stage", None)
+        if report:
+            report(job_id, stage)
+
+    def _write_trace(self, job_id: int):
+        # the trace covers the job from its claim on, including whatever overlapped it;
+        # events still needed by a job that is open are kept
+        if not self.trace_folder:
+            return
+        with self._trace_lock:
+            since = self._trace_starts.pop(job_id)
+            keep_after = min((mark[0] for mark in self._trace_starts.values()), default=tracer.now())
+        path = os.path.join(self.trace_folder, f"job_{job_id:05d}_{time.strftime('%Y%m%d_%H%M%S')}.trace.json")
+        try:
+            tracer.flush(path, since, keep_after)
+        except OSError as e:
+            log(f"job {job_id}: could not write the trace: {e}")
+            return
+        log(f"trace saved at: {path}")
+
+    def _video_stage(self):
+        # nothing may end this thread early, the calling thread would wait for it forever
+        while True:
+            item = self._ready.get()
+            if item is None:
+                return
+            self._ahead.release()
+            job, audio, timestamps, timings = item
+            try:
+                self._encode(job, audio, timestamps, timings)
+            except Exception as e:
+                log(f"job {job['id']} failed: {e}")
+                try:
+                    self.jobs.fail(job["id"], str(e), timings)
+                except Exception as e:
+                    # left running, so the next run resumes it
+                    log(f"job {job['id']}: could not record the failure: {e}")
+            self._write_trace(job["id"])
+
+    def _encode(self, job, audio, timestamps, timings):
+        output_name = job["output"] or f"job_{job['id']:05d}.mp4"
+        log(f"job {job['id']}: encoding {output_name}")
+        self._stage(job["id"], "video")
+        started = time.perf_counter()
+        try:
+            outputs = self.app.render(audio, timestamps, output_name, job["profiles"])
+        finally:
+            timings["video"] = time.perf_counter() - started
+        timings["total"] = time.time() - timings["claimed"]
+        self.jobs.finish(job["id"], ", ".join(outputs), timings)
+        log(f"job {job['id']}: done in {timings['total']:.1f}s (speech {timings['speech']:.1f}s, video {timings['video']:.1f}s)")
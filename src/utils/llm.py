@@ -0,0 +1,78 @@
+import asyncio, threading, queue
+from utils.cache import DiskCache
+
+_DONE = object()
+
+class OllamaPool:
+    # one AsyncClient, and so one pool of keep-alive connections, on a private event
+    # loop; every thread in the process shares it and its requests run concurrently
+    def __init__(self, host: str, max_connections: int = 4):
+        import httpx
+        from ollama import AsyncClient
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ollama", daemon=True)
+        self._thread.start()
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+        async def connect():
+            # the httpx client belongs to the loop it is created on
+            return AsyncClient(host=host, limits=limits)
+
+        self.client = self._submit(connect()).result()
+
+    def _submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def generate(self, **request):
+        # a concurrent.futures.Future for the whole response, the caller is not blocked
+        return self._submit(self.client.generate(stream=False, **request))
+
+    def stream(self, method: str = "generate", **request):
+        # blocking iterator over the chunks of a streamed generate or pull request
+        chunks = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in await getattr(self.client, method)(stream=True, **request):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(_DONE)
+
+        future = self._submit(pump())
+        try:
+            while (chunk := chunks.get()) is not _DONE:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            # a consumer that stops early cancels the request instead of draining it
+            future.cancel()
+
+    def close(self):
+        self._submit(self.client.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+class PromptCache:
+    # finished responses keyed by model, prompt and options; only requests that are
+    # expected to repeat exactly (temperature 0 or a fixed seed) are stored
+    def __init__(self, folder: str, max_mb=64, ttl_hours=168):
+        self.cache = DiskCache(folder, max_mb * 1024 * 1024, suffix=".txt", max_age=ttl_hours * 3600 if ttl_hours else None)
+
+    @staticmethod
+    def cacheable(options: dict) -> bool:
+        options = options or {}
+        return options.get("temperature") == 0 or options.get("seed") is not None
+
+    def get(self, model: str, prompt: str, options: dict):
+        data = self.cache.get(DiskCache.key(model, prompt, options))
+        return data.decode("utf-8") if data is not None else None
+
+    def put(self, model: str, prompt: str, options: dict, text: str):
+        self.cache.put(DiskCache.key(model, prompt, options), text.encode("utf-8"))
+
+    def stats(self):
+        return self.cache.stats()
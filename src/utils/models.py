@@ -0,0 +1,32 @@
+import threading
+from utils.log import log
+
+_factories = {}
+_instances = {}
+_lock = threading.Lock()
+
+def register(name: str, factory):
+    _factories[name] = factory
+
+def inject(name: str, instance):
+    # lets benchmarks and batch runs swap in a stub or an already-warm instance
+    with _lock:
+        _instances[name] = instance
+
+def unload(name: str):
+    # drops a loaded instance, closing it first if it holds connections or processes
+    with _lock:
+        instance = _instances.pop(name, None)
+    close = getattr(instance, "close", None)
+    if close:
+        close()
+
+def get(name: str):
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        if name not in _instances:
+            log(f"loading {name}...")
+            _instances[name] = _factories[name]()
+        return _instances[name]
@@ -0,0 +1,41 @@
+import threading, queue
+from utils.log import log
+
+_DONE = object()
+
+def stream_story_to_speech(story_gen, audio_gen, prompt: str, on_audio=None):
+    # the story stream is read on a producer thread and cut into phrase groups as
+    # tokens arrive, TTS consumes each group as soon as it is complete
+    groups = queue.Queue()
+    result = {}
+
+    def produce():
+        text = []
+
+        def chunks():
+            for chunk in story_gen.stream(prompt):
+                text.append(chunk)
+                yield chunk
+
+        try:
+            try:
+                for group in audio_gen._split_stream(chunks()):
+                    groups.put(group)
+            finally:
+                groups.put(_DONE)
+            story_text = "".join(text).strip()
+            # the caption overlaps with the remaining TTS work
+            topic = story_gen.caption(story_text) if story_text else ""
+            result["story"] = {"story": story_text, "topic": topic}
+        except Exception as e:
+            log(f"error generating story: {e}")
+            result["error"] = e
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    audio, timestamps = audio_gen.speak_groups(iter(groups.get, _DONE), on_audio=on_audio)
+    producer.join()
+    # fail the job like the sequential path does, not with half a story
+    if "error" in result:
+        raise result["error"]
+    return result["story"], audio, timestamps
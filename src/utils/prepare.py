@@ -0,0 +1,62 @@
+import os, subprocess
+from utils.log import log
+from utils.probe import ProbeIndex
+
+def prepared_folder(root: str, resolution: str, fps: int):
+    return os.path.join(root, f"{resolution}_{fps}")
+
+def prepare_backgrounds(config: dict, force: bool = False):
+    # one-time transcode of the background library to the output size and frame rate
+    # with a fixed keyframe interval, so renders can skip scaling and cut on keyframes
+    resolution = config["config"]["video_resolution"]
+    width, height = map(int, resolution.split('x'))
+    fps = int(config["config"].get("video_fps", 60))
+    gop = max(1, int(round(float(config["config"].get("background_keyframe_seconds", 2)) * fps)))
+    source_folder = config["paths"]["video_backgrounds"]
+    target_folder = prepared_folder(config["paths"]["prepared_backgrounds"], resolution, fps)
+    os.makedirs(target_folder, exist_ok=True)
+
+    sources = ProbeIndex(source_folder, config["paths"].get("probe_index")).refresh()
+    prepared = []
+    for i, source in enumerate(sources):
+        name = os.path.splitext(os.path.basename(source["path"]))[0] + ".mp4"
+        target = os.path.join(target_folder, name)
+        if not force and os.path.exists(target) and os.path.getmtime(target) >= source["mtime"]:
+            prepared.append(target)
+            continue
+        log(f"preparing background {i + 1}/{len(sources)}: {name}")
+        temp_target = target + ".part"
+        ffmpeg_cmd = [
+            "ffmpeg", "-y", "-i", source["path"],
+            "-an",
+            "-vf", (
+                f"scale={width}:{height}:force_original_aspect_ratio=increase:flags=lanczos,"
+                f"crop={width}:{height},fps={fps}"
+            ),
+            "-c:v", "libx264",
+            "-preset", "medium",
+            "-crf", "18",
+            "-pix_fmt", "yuv420p",
+            "-g", str(gop),
+            "-keyint_min", str(gop),
+            "-sc_threshold", "0",
+            "-movflags", "+faststart",
+            "-f", "mp4",
+            temp_target
+        ]
+        if not config.get("debug", False):
+            subprocess.run(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, check=True)
+        else:
+            subprocess.run(ffmpeg_cmd, check=True)
+        os.replace(temp_target, target)
+        prepared.append(target)
+
+    # drop variants whose source is gone
+    expected = {os.path.basename(path) for path in prepared}
+    for name in os.listdir(target_folder):
+        if name.endswith(".mp4") and name not in expected:
+            os.remove(os.path.join(target_folder, name))
+
+    ProbeIndex(target_folder).refresh()
+    log(f"{len(prepared)} backgrounds ready in {target_folder}")
+    return prepared
@@ -0,0 +1,112 @@
+import os, json, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.log import log
+from utils.trace import tracer
+from utils.files import write_json
+
+VIDEO_EXTENSIONS = (".mp4", ".mov")
+INDEX_VERSION = 1
+
+def probe_duration(path: str) -> float:
+    tracer.count("ffprobe_calls")
+    return float(subprocess.check_output([
+        "ffprobe", "-v", "error", "-show_entries",
+        "format=duration", "-of",
+        "default=noprint_wrappers=1:nokey=1", path
+    ]).strip())
+
+def probe_video(path: str) -> dict:
+    tracer.count("ffprobe_calls", 2)
+    info = json.loads(subprocess.check_output([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,width,height,avg_frame_rate:format=duration",
+        "-of", "json", path
+    ]))
+    stream = (info.get("streams") or [{}])[0]
+    # packet flags carry the keyframe marker, so this reads the container without decoding
+    packets = subprocess.check_output([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path
+    ], text=True)
+    keyframes = sorted(
+        float(pts) for pts, _, flags in (line.partition(",") for line in packets.splitlines())
+        if "K" in flags and pts not in ("", "N/A")
+    )
+    return {
+        "duration": float(info["format"]["duration"]),
+        "width": int(stream.get("width", 0)),
+        "height": int(stream.get("height", 0)),
+        "codec": stream.get("codec_name", ""),
+        "fps": _parse_rate(stream.get("avg_frame_rate", "0/1")),
+        "keyframes": keyframes or [0.0]
+    }
+
+def _parse_rate(rate: str) -> float:
+    numerator, _, denominator = rate.partition("/")
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+class ProbeIndex:
+    def __init__(self, folder: str, index_path: str = None, workers: int = None):
+        self.folder = folder
+        self.index_path = index_path or os.path.join(folder, ".probe_index.json")
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    def refresh(self):
+        # stats every file (no subprocess), re-probes only new or changed ones
+        with self._lock:
+            current = {}
+            for name in sorted(os.listdir(self.folder)):
+                if not name.endswith(VIDEO_EXTENSIONS):
+                    continue
+                stat = os.stat(os.path.join(self.folder, name))
+                current[name] = (stat.st_mtime, stat.st_size)
+
+            stale = [
+                name for name, (mtime, size) in current.items()
+                if name not in self.entries
+                or self.entries[name]["mtime"] != mtime
+                or self.entries[name]["size"] != size
+            ]
+            removed = [name for name in self.entries if name not in current]
+            if stale:
+                log(f"probing {len(stale)} background clips...")
+                with ThreadPoolExecutor(self.workers) as pool:
+                    probed = pool.map(lambda name: self._probe(name, *current[name]), stale)
+                    for name, entry in zip(stale, probed):
+                        if entry is None:
+                            self.entries.pop(name, None)
+                        else:
+                            self.entries[name] = entry
+            for name in removed:
+                del self.entries[name]
+            if stale or removed:
+                self._save()
+
+            return [dict(self.entries[name], path=os.path.join(self.folder, name)) for name in current if name in self.entries]
+
+    def _probe(self, name: str, mtime: float, size: int):
+        try:
+            entry = probe_video(os.path.join(self.folder, name))
+        except (subprocess.CalledProcessError, KeyError, ValueError) as e:
+            log(f"skipping unreadable background {name}: {e}")
+            return None
+        entry.update(mtime=mtime, size=size)
+        return entry
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return data.get("files", {})
+
+    def _save(self):
+        write_json(self.index_path, {"version": INDEX_VERSION, "files": self.entries})
@@ -1,13 +1,41 @@
-from ollama import Client
+import os, time
 from utils.log import log
+from utils import models
+from utils.llm import OllamaPool, PromptCache
+from utils.trace import tracer
 
 _test = True
+_TEST_STORY = "Generate a dramatic, intense, modern Reddit-style story centered on toxic family dynamics or broken relationships. The story MUST START with a Reddit-style question addressed to readers, such as: 'Redditors, am I wrong for what I did?'. The tone should be heavy, emotional, and high-stakes, with shocking reveals, extreme situations, and lasting consequences. Themes may include faking one's own funeral to discover who truly cared, or a partner whose social media fame leads them to humiliate the protagonist publicly until they face harsh consequences. The story should be long, immersive, and include a powerful twist. Provide only the story, no title, no extra commentary, no extra markdown (such as *, __ etc.)."
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", 'http://localhost:11434')
+OLLAMA_CONNECTIONS = int(os.environ.get("OLLAMA_CONNECTIONS", 4))
+CAPTION_PROMPT = "Generate a short, catchy caption for the following story in one line:\n\n{}"
+
+def _load_client():
+    return OllamaPool(OLLAMA_HOST, OLLAMA_CONNECTIONS)
+
+models.register("ollama", _load_client)
 
 class StoryGenerator:
-    def __init__(self, model="gemma3:4b"):
+    def __init__(self, model="gemma3:4b", options=None, cache_dir=None, cache_max_mb=64, cache_ttl_hours=168,
+                 caption_after_chars=1200):
         self.model = model
-        self.client = Client(host='http://localhost:11434')
-        self._ensure_model()
+        self.options = dict(options or {})
+        # sampled runs are never cached, every run is meant to tell a new story
+        self.cache = PromptCache(cache_dir, cache_max_mb, cache_ttl_hours) if cache_dir and PromptCache.cacheable(self.options) else None
+        # the caption is asked for once this much story exists, while the rest is still generating; 0 waits for the whole story
+        self.caption_after_chars = caption_after_chars
+        self._early_caption = None
+        self._ready = False
+
+    @property
+    def client(self):
+        return models.get("ollama")
+
+    def _ensure_ready(self):
+        # deferred until the first request so building the app never blocks on ollama
+        if not self._ready:
+            self._ensure_model()
+            self._ready = True
 
     def _ensure_model(self):
         if not _test:
@@ -17,13 +45,13 @@ class StoryGenerator:
                     model=self.model, 
                     prompt="test",
                     options={'num_predict': 5}
-                )
+                ).result()
                 log(f"model '{self.model}' is ready!")
             except Exception as e:
                 log(f"model '{self.model}' not ready: {e}")
                 log("pulling model...")
                 current_digest = ""
-                for progress in self.client.pull(self.model, stream=True):
+                for progress in self.client.stream("pull", model=self.model):
                     digest = progress.get('digest', '')
                     if digest != current_digest:
                         if 'total' in progress and 'completed' in progress:
@@ -34,45 +62,120 @@ class StoryGenerator:
                 self._ensure_model()
 
     def generate(self, prompt: str = None) -> dict:
+        try:
+            story_text = "".join(self.stream(prompt))
+        except Exception as e:
+            # raised like the streaming path, a job must fail rather than narrate the error
+            log(f"error generating story: {e}")
+            raise
+        return {"story": story_text.strip(), "topic": self.caption(story_text)}
+
+    def stream(self, prompt: str = None):
+        self._ensure_ready()
+        self._early_caption = None
         if _test:
-            story_text = "Generate a dramatic, intense, modern Reddit-style story centered on toxic family dynamics or broken relationships. The story MUST START with a Reddit-style question addressed to readers, such as: 'Redditors, am I wrong for what I did?'. The tone should be heavy, emotional, and high-stakes, with shocking reveals, extreme situations, and lasting consequences. Themes may include faking one's own funeral to discover who truly cared, or a partner whose social media fame leads them to humiliate the protagonist publicly until they face harsh consequences. The story should be long, immersive, and include a powerful twist. Provide only the story, no title, no extra commentary, no extra markdown (such as *, __ etc.)."
-        else:
-            log("generating story...")
-            story_text = ""
-            try:
-                stream_response = self.client.generate(
-                    model=self.model, 
-                    prompt=prompt,
-                    stream=True
-                )
-                for chunk in stream_response:
-                    if 'response' in chunk:
-                        story_text += chunk['response']
-                    if 'done' in chunk and chunk['done']:
-                        break
-            except Exception as e:
-                log(f"error generating story: {e}")
-                return {"story": f"error: {e}", "topic": ""}
+            with tracer.span("story", model="test") as args:
+                words = _TEST_STORY.split(" ")
+                for word in words:
+                    yield word + " "
+                args.update(tokens=len(words))
+            return
+        cached = self.cache.get(self.model, prompt, self.options) if self.cache else None
+        if cached is not None:
+            with tracer.span("story", model=self.model, cached=True):
+                self._start_caption(cached)
+                yield cached
+            return
+        log("generating story...")
+        with tracer.span("story", model=self.model) as args:
+            started = time.perf_counter()
+            tokens = 0
+            text = []
+            length = 0
+            stream_response = self.client.stream(
+                model=self.model,
+                prompt=prompt,
+                options=self.options or None
+            )
+            for chunk in stream_response:
+                if 'response' in chunk:
+                    tokens += 1
+                    text.append(chunk['response'])
+                    length += len(chunk['response'])
+                    if self._early_caption is None and self.caption_after_chars and length > self.caption_after_chars:
+                        self._start_caption("".join(text))
+                    yield chunk['response']
+                if 'done' in chunk and chunk['done']:
+                    # ollama reports the exact count on the last chunk
+                    if 'eval_count' in chunk and chunk['eval_count']:
+                        tokens = chunk['eval_count']
+                    break
+            elapsed = time.perf_counter() - started
+            args.update(tokens=tokens, tokens_per_second=round(tokens / elapsed, 2) if elapsed else None)
+        if self.cache:
+            self.cache.put(self.model, prompt, self.options, "".join(text))
+
+    def _excerpt(self, story_text: str) -> str:
+        # the same opening for a streamed and a cached story, so the caption prompt
+        # does not depend on how the text was chunked
+        if not self.caption_after_chars or len(story_text) <= self.caption_after_chars:
+            return story_text
+        excerpt = story_text[:self.caption_after_chars]
+        return excerpt[:excerpt.rfind(" ")] if " " in excerpt else excerpt
+
+    def _start_caption(self, story_text: str):
+        if not self.caption_after_chars or len(story_text) <= self.caption_after_chars:
+            return
+        prompt = CAPTION_PROMPT.format(self._excerpt(story_text))
+        cached = self.cache.get(self.model, prompt, self.options) if self.cache else None
+        if cached is not None:
+            self._early_caption = (prompt, cached)
+            return
+        log("generating caption from the opening of the story...")
+        started = time.perf_counter()
+        future = self.client.generate(model=self.model, prompt=prompt, options=self.options or None)
+        future.add_done_callback(lambda _: tracer.complete("caption", time.perf_counter() - started, model=self.model, early=True))
+        self._early_caption = (prompt, future)
+
+    def caption(self, story_text: str) -> str:
+        early, self._early_caption = self._early_caption, None
+        if early is not None:
+            prompt, response = early
+            if isinstance(response, str):
+                return response
+            with tracer.span("caption_wait", model=self.model):
+                try:
+                    topic_text = response.result()['response'].strip()
+                except Exception as e:
+                    log(f"error generating caption: {e}")
+                    return ""
+            if self.cache:
+                self.cache.put(self.model, prompt, self.options, topic_text)
+            return topic_text
+        with tracer.span("caption", model=self.model):
+            return self._caption(story_text)
 
+    def _caption(self, story_text: str) -> str:
         log("generating caption based on story...")
         topic_text = ""
-        caption_prompt = f"Generate a short, catchy caption for the following story in one line:\n\n{story_text}"
+        caption_prompt = CAPTION_PROMPT.format(self._excerpt(story_text))
         if _test:
             topic_text = "A shocking tale of betrayal and family secrets."
         else:
+            cached = self.cache.get(self.model, caption_prompt, self.options) if self.cache else None
+            if cached is not None:
+                return cached
             try:
-                stream_caption = self.client.generate(
+                response = self.client.generate(
                     model=self.model,
                     prompt=caption_prompt,
-                    stream=True
-                )
-                for chunk in stream_caption:
-                    if 'response' in chunk:
-                        topic_text += chunk['response']
-                    if 'done' in chunk and chunk['done']:
-                        break
+                    options=self.options or None
+                ).result()
+                topic_text = response['response']
             except Exception as e:
                 log(f"error generating caption: {e}")
-                topic_text = ""
+                return ""
+            if self.cache:
+                self.cache.put(self.model, caption_prompt, self.options, topic_text.strip())
 
-        return {"story": story_text.strip(), "topic": topic_text.strip()}
+        return topic_text.strip()
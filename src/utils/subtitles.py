@@ -0,0 +1,153 @@
+import io, os, math, threading
+from PIL import Image, ImageDraw, ImageFont
+from fontTools.ttLib import TTFont
+from utils.cache import DiskCache
+
+# matches the ASS style written by VideoCreator: white text, 3px black outline,
+# centered, popping in from 60 to 75 over the first 150ms of each block
+FONT_SIZE = 75
+POP_FONT_SIZE = 60
+POP_SECONDS = 0.15
+OUTLINE = 3
+
+def _libass_metrics(font_path: str):
+    # libass sizes a font so that winAscent + winDescent spans the requested size and
+    # centers that box, Pillow sizes it by the em square
+    font = TTFont(font_path, lazy=True)
+    os2 = font["OS/2"]
+    height = float(os2.usWinAscent + os2.usWinDescent)
+    return font["head"].unitsPerEm / height, os2.usWinAscent / height
+
+class SubtitleRenderer:
+    # draws every caption block (and each step of its pop-in) once with Pillow, so
+    # the encode only overlays a still image that changes at caption boundaries
+    def __init__(self, font_path: str, width: int, height: int, fps: int, cache_dir: str = None, cache_max_mb=128,
+                 scale: float = 1.0):
+        # scale maps the ASS script resolution to this output, as libass does for smaller renders
+        self.font_path = font_path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.em_scale, self.ascent = _libass_metrics(font_path)
+        self.scale = scale
+        self.outline = max(1, int(round(OUTLINE * scale)))
+        self.cache = DiskCache(cache_dir, cache_max_mb * 1024 * 1024, suffix=".tiff") if cache_dir else None
+        self._fonts = {}
+        self._last_text = self._last_image = None
+        # segments are encoded from several threads and FreeType faces are not thread-safe
+        self._lock = threading.Lock()
+        # a band across the middle of the frame, tall enough for the largest size
+        self.band_height = (int(round(FONT_SIZE * scale)) + 2 * self.outline + 8 + 1) // 2 * 2
+        self.band_y = (height - self.band_height) // 2 // 2 * 2
+
+    def _font(self, size: float):
+        pixels = max(1, int(round(size * self.em_scale * self.scale)))
+        if pixels not in self._fonts:
+            self._fonts[pixels] = ImageFont.truetype(self.font_path, pixels)
+        return self._fonts[pixels]
+
+    def _full_size(self, text: str):
+        # the outlined text at its resting size; stroking is the slow part of drawing,
+        # so it happens once per block and the pop-in frames are scaled from it
+        if self._last_text != text:
+            image = Image.new("RGBA", (self.width, self.band_height), (0, 0, 0, 0))
+            line_height = FONT_SIZE * self.scale
+            baseline = self.height / 2 - self.band_y - line_height / 2 + line_height * self.ascent
+            ImageDraw.Draw(image).text(
+                (self.width / 2, baseline), text, font=self._font(FONT_SIZE), anchor="ms",
+                fill=(255, 255, 255, 255), stroke_width=self.outline, stroke_fill=(0, 0, 0, 255)
+            )
+            self._last_text, self._last_image = text, image
+        return self._last_image
+
+    def _draw(self, text: str, size: float) -> bytes:
+        image = self._full_size(text)
+        box = image.getbbox()
+        if size != FONT_SIZE and box:
+            # scaled around the frame center, which is where \an5 anchors the line
+            scale = size / FONT_SIZE
+            center_x, center_y = self.width / 2, self.height / 2 - self.band_y
+            sprite = image.crop(box)
+            sprite = sprite.resize(
+                (max(1, round(sprite.width * scale)), max(1, round(sprite.height * scale))), Image.LANCZOS
+            )
+            image = Image.new("RGBA", (self.width, self.band_height), (0, 0, 0, 0))
+            image.paste(sprite, (round(center_x + (box[0] - center_x) * scale), round(center_y + (box[1] - center_y) * scale)))
+        output = io.BytesIO()
+        # packbits is several times cheaper to write than png and still small for a mostly empty band
+        image.save(output, format="TIFF", compression="packbits")
+        return output.getvalue()
+
+    def image(self, text: str, size: float, work_dir: str, rendered: dict) -> str:
+        # one file per distinct (text, size) in this render, drawn or taken from the cache
+        pixels = int(round(size * self.em_scale * self.scale))
+        key = DiskCache.key(text, pixels, self.width, self.band_height, self.outline, os.path.basename(self.font_path))
+        if key in rendered:
+            return rendered[key]
+        data = self.cache.get(key) if self.cache else None
+        if data is None:
+            with self._lock:
+                data = self._draw(text, size)
+            if self.cache:
+                self.cache.put(key, data)
+        path = os.path.join(work_dir, f"caption_{len(rendered):05d}.tiff")
+        with open(path, "wb") as f:
+            f.write(data)
+        rendered[key] = path
+        return path
+
+    def blank(self, work_dir: str) -> str:
+        path = os.path.join(work_dir, "blank.tiff")
+        if not os.path.exists(path):
+            Image.new("RGBA", (self.width, self.band_height), (0, 0, 0, 0)).save(path, format="TIFF", compression="packbits")
+        return path
+
+    def schedule(self, timestamps: list, duration: float, work_dir: str):
+        # (image, start) pairs in time order; each image holds until the next one starts
+        rendered = {}
+        blank = self.blank(work_dir)
+        schedule = [(blank, 0.0)]
+        step = 1.0 / self.fps
+        for ts in timestamps:
+            start, end = ts["start"], min(ts["end"], duration)
+            if end <= start:
+                continue
+            # a block cut by a segment boundary resumes its pop-in where it was
+            lead = ts.get("lead", 0)
+            frames = max(0, math.ceil((POP_SECONDS - lead) * self.fps))
+            for k in range(frames):
+                at = start + k * step
+                if at >= end:
+                    break
+                progress = min(1.0, (lead + k * step) / POP_SECONDS)
+                size = POP_FONT_SIZE + (FONT_SIZE - POP_FONT_SIZE) * progress
+                schedule.append((self.image(ts["text"], size, work_dir, rendered), at))
+            at = start + frames * step
+            if at < end:
+                schedule.append((self.image(ts["text"], FONT_SIZE, work_dir, rendered), at))
+            schedule.append((blank, end))
+
+        merged = []
+        for image, start in sorted(schedule, key=lambda item: item[1]):
+            if merged and merged[-1][1] >= start - 1e-6:
+                merged[-1] = (image, merged[-1][1])
+            elif not merged or merged[-1][0] != image:
+                merged.append((image, start))
+        return merged
+
+    def write_concat_list(self, timestamps: list, duration: float, work_dir: str) -> str:
+        schedule = self.schedule(timestamps, duration, work_dir)
+        concat_file = os.path.join(work_dir, "captions.txt")
+        # starts are floored to whole microseconds, so an image is never later
+        # than the frame it belongs to
+        starts = [math.floor(start * 1e6) for _, start in schedule] + [math.floor(duration * 1e6)]
+        with open(concat_file, "w") as f:
+            for (image, _), start, next_start in zip(schedule, starts, starts[1:]):
+                f.write(f"file '{image}'\n")
+                # images default to a 1/25s time base, which would round the starts
+                f.write("option framerate 1000000\n")
+                f.write(f"duration {max(next_start - start, 0) / 1e6:.6f}\n")
+            # the concat demuxer ignores the duration of the last entry unless it is repeated
+            f.write(f"file '{schedule[-1][0]}'\n")
+            f.write("option framerate 1000000\n")
+        return concat_file
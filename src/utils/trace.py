@@ -0,0 +1,162 @@
+import os, json, time, threading, resource
+from contextlib import contextmanager
+from utils.log import log
+
+class Tracer:
+    # collects Chrome trace format events (chrome://tracing, ui.perfetto.dev);
+    # everything is a no-op until enable() is called
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        with self._lock:
+            self.enabled = True
+            self.events = []
+            self.counters = {}
+            self._origin = time.perf_counter()
+            self._wall_start = time.time()
+            self._cpu_start = time.process_time()
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def now(self):
+        # a position on the trace clock, for flush()
+        return self._now_us()
+
+    def mark(self):
+        # trace clock, wall clock and cpu readings, so flush() can report a window
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return self._now_us(), time.time(), time.process_time(), children.ru_utime + children.ru_stime
+
+    def _append(self, event):
+        event.setdefault("pid", os.getpid())
+        event.setdefault("tid", threading.get_ident())
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, **args):
+        # args may be filled in by the caller while the span is open
+        if not self.enabled:
+            yield args
+            return
+        start = self._now_us()
+        cpu_start = time.thread_time()
+        try:
+            yield args
+        finally:
+            args["cpu_ms"] = round((time.thread_time() - cpu_start) * 1000, 3)
+            self._append({"name": name, "ph": "X", "ts": start, "dur": self._now_us() - start, "args": args})
+
+    def complete(self, name: str, seconds: float, **args):
+        # a span measured elsewhere (e.g. in a worker process), ending now
+        if not self.enabled:
+            return
+        end = self._now_us()
+        self._append({"name": name, "ph": "X", "ts": end - seconds * 1e6, "dur": seconds * 1e6, "args": args})
+
+    def counter(self, name: str, **values):
+        if self.enabled:
+            self._append({"name": name, "ph": "C", "ts": self._now_us(), "args": values})
+
+    def count(self, name: str, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self, since=None):
+        # since enable(), or since a mark() for a window such as one job
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        _, wall_start, cpu_start, children_cpu_start = since or (None, self._wall_start, self._cpu_start, 0.0)
+        summary = {
+            "wall_seconds": round(time.time() - wall_start, 3),
+            "cpu_seconds": round(time.process_time() - cpu_start, 3),
+            "children_cpu_seconds": round(children.ru_utime + children.ru_stime - children_cpu_start, 3),
+        }
+        # ru_maxrss is in kilobytes on linux, and a peak over the whole process that
+        # cannot be split into windows, so a window names it as such
+        prefix = "process_" if since else ""
+        summary[prefix + "peak_rss_mb"] = round(own.ru_maxrss / 1024, 1)
+        summary[prefix + "children_peak_rss_mb"] = round(children.ru_maxrss / 1024, 1)
+        summary["counters"] = dict(self.counters)
+        return summary
+
+    def write(self, path: str, events=None, since=None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if events is None:
+            with self._lock:
+                events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "metadata": self.summary(since)}, f)
+        return path
+
+    def flush(self, path: str, since, keep_after: float):
+        # writes the events still running at the `since` mark or later, then forgets
+        # those that ended before `keep_after` along with the counters, so a long-lived
+        # process writes one bounded trace per job instead of one that grows until it exits
+        with self._lock:
+            events = [event for event in self.events if event["ts"] + event.get("dur", 0) >= since[0]]
+            self.events = [event for event in self.events if event["ts"] + event.get("dur", 0) >= keep_after]
+        self.write(path, events, since)
+        with self._lock:
+            self.counters = {}
+        return path
+
+tracer = Tracer()
+
+def trace_folder(config: dict):
+    settings = config.get("profiling") or {}
+    return settings.get("folder", "./output/traces") if settings.get("trace") else None
+
+@contextmanager
+def profiled(config: dict, name: str, trace=True):
+    # switched from the profiling section of config.yml; trace=False leaves the
+    # trace to the caller, e.g. BatchRunner writing one per job
+    settings = dict(config.get("profiling") or {})
+    settings["trace"] = trace and settings.get("trace")
+    if not any(settings.get(key) for key in ("trace", "cprofile", "tracemalloc")):
+        yield
+        return
+    folder = settings.get("folder", "./output/traces")
+    stem = os.path.join(folder, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(folder, exist_ok=True)
+
+    profiler = None
+    if settings.get("cprofile"):
+        import cProfile
+        profiler = cProfile.Profile()
+    if settings.get("tracemalloc"):
+        import tracemalloc
+        tracemalloc.start(int(settings.get("tracemalloc_frames", 1)))
+    if settings.get("trace"):
+        tracer.enable()
+    if profiler:
+        profiler.enable()
+    try:
+        with tracer.span(name):
+            yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(stem + ".prof")
+            log(f"cprofile stats saved at: {stem}.prof")
+        if settings.get("tracemalloc"):
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            tracer.counters["tracemalloc_peak_mb"] = round(peak / 1024 / 1024, 1)
+            with open(stem + ".tracemalloc.txt", "w") as f:
+                for stat in snapshot.statistics("lineno")[:int(settings.get("tracemalloc_top", 25))]:
+                    f.write(f"{stat}\n")
+            log(f"tracemalloc top allocations saved at: {stem}.tracemalloc.txt")
+        if tracer.enabled:
+            tracer.write(stem + ".trace.json")
+            tracer.enabled = False
+            log(f"trace saved at: {stem}.trace.json")
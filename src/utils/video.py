@@ -1,130 +1,366 @@
-import os, random
+import os, random, re, sys, time, threading
 import subprocess, string
+import tempfile, shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from utils.log import log
+from utils.trace import tracer
+from utils.probe import ProbeIndex, probe_duration
+from utils.prepare import prepared_folder
+from utils.subtitles import SubtitleRenderer
+from utils.backgrounds import BackgroundHistory, BackgroundScheduler, sequential_plan, write_concat_list
+from utils.encoders import resolve_profile, video_codec_args, audio_codec_args, container_args
 from fontTools.ttLib import TTFont
 
+_FFMPEG_STATS = re.compile(rb"frame=\s*(\d+)\s+fps=\s*([\d.]+).*?speed=\s*([\d.]+)?x")
+
 class VideoCreator:
     def __init__(self, backgrounds_folder: str, config: dict):
         self.backgrounds_folder = backgrounds_folder
         self.config = config
         self.resolution = config["config"]["video_resolution"]
         self.width, self.height = map(int, self.resolution.split('x'))
+        self.fps = int(config["config"].get("video_fps", 60))
+        self.index = ProbeIndex(backgrounds_folder, config["paths"].get("probe_index"))
+        self.prepared_index = None
+        prepared_root = config["paths"].get("prepared_backgrounds")
+        if prepared_root:
+            self.prepared_folder = prepared_folder(prepared_root, self.resolution, self.fps)
+            if os.path.isdir(self.prepared_folder):
+                self.prepared_index = ProbeIndex(self.prepared_folder)
+        self.subtitle_renderer = config["config"].get("subtitle_renderer", "libass")
+        self._subtitles = {}
+        self.background_order = config["config"].get("background_order", "random")
+        self.scheduler = BackgroundScheduler(BackgroundHistory(
+            config["paths"].get("background_history"),
+            config["config"].get("background_history_renders", 20)
+        ))
 
-    def create_video(self, audio_path: str, timestamps=None):
-        files = [
-            os.path.join(self.backgrounds_folder, f)
-            for f in os.listdir(self.backgrounds_folder)
-            if f.endswith((".mp4", ".mov"))
-        ]
+    def create_video(self, audio, timestamps=None, output_name="final_video.mp4", profiles=None):
+        # audio is an AudioTrack streamed over stdin, or the path of an audio file; every
+        # encoder profile asked for is rendered from one decode of the backgrounds and
+        # the output paths come back in the same order
+        profiles = [resolve_profile(self.config, name) for name in (profiles or [None])]
+        files, prepared = self._background_clips()
         if not files:
             raise ValueError("no background videos found in folder.")
 
-        audio_duration = float(subprocess.check_output([
-            "ffprobe", "-v", "error", "-show_entries",
-            "format=duration", "-of",
-            "default=noprint_wrappers=1:nokey=1", audio_path
-        ]).strip())
+        audio_duration = probe_duration(audio) if isinstance(audio, str) else audio.duration
 
         output_dir = os.path.abspath(self.config["paths"]["output_video"])
         os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, "final_video.mp4")
+        output_paths = self._output_paths(output_dir, output_name, profiles)
 
-        if timestamps:
-            self._create_video_with_subtitles_single_pass(files, audio_path, audio_duration, timestamps, output_path)
+        segments = self._segment_count(audio_duration)
+        if segments > 1:
+            self._create_video_segmented(files, audio, audio_duration, timestamps, output_paths, profiles, prepared, segments)
         else:
-            self._create_video_single_pass(files, audio_path, audio_duration, output_path)
-
-        return output_path
+            self._create_video_single_pass(files, audio, audio_duration, timestamps, output_paths, profiles, prepared)
 
-    def _create_video_with_subtitles_single_pass(self, files, audio_path, audio_duration, timestamps, output_path):
-        subtitle_file = "/tmp/subtitles.ass"
-        self._create_subtitle_ass_file(timestamps, subtitle_file, audio_duration)
+        return output_paths
 
-        concat_file = "/tmp/concat_list.txt"
-        self._create_concat_list(files, audio_duration, concat_file)
+    def _output_paths(self, output_dir: str, output_name: str, profiles):
+        if len(profiles) == 1:
+            return [os.path.join(output_dir, output_name)]
+        stem, extension = os.path.splitext(output_name)
+        return [os.path.join(output_dir, f"{stem}_{profile['name']}{extension or '.mp4'}") for profile in profiles]
 
-        subtitle_file_abs = os.path.abspath(subtitle_file)
-        vf_filter = (
-            f"scale={self.width}:{self.height}:force_original_aspect_ratio=increase:flags=lanczos,"
-            f"crop={self.width}:{self.height},subtitles={subtitle_file_abs}:fontsdir=sources/fonts:force_style='Outline=3'"
-        )
+    def _background_clips(self):
+        # prepared clips already match the output size and rate, so the render can skip
+        # scaling and only has to burn in subtitles
+        if self.prepared_index:
+            clips = [clip for clip in self.prepared_index.refresh() if clip["duration"] > 0]
+            if clips:
+                return clips, True
+            log(f"no prepared backgrounds in {self.prepared_folder}, scaling originals")
+        return [clip for clip in self.index.refresh() if clip["duration"] > 0], False
 
-        ffmpeg_cmd = [
-            "ffmpeg", "-y",
-            "-f", "concat", "-safe", "0", "-i", concat_file,
-            "-i", audio_path,
-            "-vf", vf_filter,
-            "-r", "60",
-            "-c:v", "libx264",
-            "-preset", "ultrafast",
-            "-crf", "28",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-map", "0:v:0",
-            "-map", "1:a:0",
-            "-shortest",
-            "-stats",
-            output_path
+    def _scale_filters(self, prepared: bool, width: int = None, height: int = None):
+        width, height = width or self.width, height or self.height
+        if prepared and (width, height) == (self.width, self.height):
+            return []
+        return [
+            f"scale={width}:{height}:force_original_aspect_ratio=increase:flags=lanczos",
+            f"crop={width}:{height}"
         ]
-        if not self.config.get("debug", False):
-            subprocess.run(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, check=True)
-        else:
-            subprocess.run(ffmpeg_cmd, check=True)
 
-        if os.path.exists(concat_file):
-            os.remove(concat_file)
-        if os.path.exists(subtitle_file):
-            os.remove(subtitle_file)
+    def _rate_args(self, profile: dict, prepared: bool):
+        return [] if prepared and profile["fps"] == self.fps else ["-r", str(profile["fps"])]
+
+    def _audio_input_args(self, audio):
+        return ["-i", audio] if isinstance(audio, str) else audio.input_args()
+
+    def _run_ffmpeg(self, ffmpeg_cmd, name="encode", echo=None, audio=None):
+        # stderr is read here so the -stats lines can be traced, and echoed in debug
+        echo = self.config.get("debug", False) if echo is None else echo
+        piped = audio is not None and not isinstance(audio, str)
+        with tracer.span(name) as args:
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                ffmpeg_cmd,
+                stdin=subprocess.PIPE if piped else None,
+                stdout=None if echo else subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+            feeder = None
+            if piped:
+                # fed from its own thread so a full stdin pipe never blocks reading stderr
+                feeder = threading.Thread(target=self._feed_audio, args=(audio, process.stdin), daemon=True)
+                feeder.start()
+            pending = b""
+            last = None
+            while True:
+                chunk = process.stderr.read1(4096)
+                if not chunk:
+                    break
+                if echo:
+                    sys.stderr.buffer.write(chunk)
+                    sys.stderr.flush()
+                *lines, pending = re.split(rb"[\r\n]", pending + chunk)
+                for line in lines:
+                    stats = _FFMPEG_STATS.search(line)
+                    if stats:
+                        last = stats
+                        tracer.counter(f"{name}_fps", fps=float(stats.group(2)))
+            returncode = process.wait()
+            if feeder:
+                feeder.join()
+            if last:
+                # ffmpeg's own fps is a running estimate, so report the average over the whole run
+                frames = int(last.group(1))
+                args.update(frames=frames, fps=round(frames / (time.perf_counter() - started), 1), speed=float(last.group(3) or 0))
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, ffmpeg_cmd)
+
+    def _feed_audio(self, audio, stdin):
+        try:
+            audio.write_to(stdin)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg stopped reading early (-shortest or an error reported on stderr)
+            pass
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def _create_video_single_pass(self, files, audio, audio_duration, timestamps, output_paths, profiles, prepared=False):
+        work_dir = tempfile.mkdtemp(dir="/tmp", prefix="render_")
+        try:
+            concat_file = os.path.join(work_dir, "concat_list.txt")
+            self._create_concat_list(files, audio_duration, concat_file)
+            profile = profiles[0]
+            if (prepared and not timestamps and len(profiles) == 1 and profile["fps"] == self.fps
+                    and (profile["width"], profile["height"]) == (self.width, self.height)):
+                # prepared clips need no filtering at all, so their packets are copied as-is
+                caption_inputs, graph, labels = [], [], ["0:v:0"]
+                video_args = [["-c:v", "copy"]]
+            else:
+                # the captions (if drawn by the overlay renderer) start at input 2, after the audio
+                caption_inputs, graph, labels = self._video_graph(profiles, timestamps, audio_duration, prepared, work_dir, 2)
+                video_args = [[*self._rate_args(profile, prepared), *video_codec_args(profile)] for profile in profiles]
 
-    def _create_video_single_pass(self, files, audio_path, audio_duration, output_path):
-        concat_file = "/tmp/concat_list.txt"
-        self._create_concat_list(files, audio_duration, concat_file)
+            ffmpeg_cmd = [
+                "ffmpeg", "-y",
+                "-f", "concat", "-safe", "0", "-i", concat_file,
+                *self._audio_input_args(audio),
+                *caption_inputs,
+                *graph,
+                "-stats"
+            ]
+            for profile, label, codec_args, output_path in zip(profiles, labels, video_args, output_paths):
+                ffmpeg_cmd += [
+                    "-map", label,
+                    "-map", "1:a:0",
+                    *codec_args,
+                    *audio_codec_args(profile),
+                    *container_args(profile),
+                    "-shortest",
+                    output_path
+                ]
+            self._run_ffmpeg(ffmpeg_cmd, audio=audio)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
 
+    def _video_graph(self, profiles, timestamps, duration: float, prepared: bool, work_dir: str, caption_input: int):
+        # returns (extra inputs, filter arguments, one output label per profile); the decoded
+        # backgrounds are split once and each branch is scaled and captioned for its profile
+        inputs, graph, labels = [], [], []
+        sources = [f"[source{i}]" for i in range(len(profiles))] if len(profiles) > 1 else ["[0:v]"]
+        if len(profiles) > 1:
+            graph.append(f"[0:v]split={len(profiles)}{''.join(sources)}")
+        subtitle_file = None
+        for i, (profile, source) in enumerate(zip(profiles, sources)):
+            filters = ",".join(self._scale_filters(prepared, profile["width"], profile["height"])) or "null"
+            label = f"[video{i}]"
+            if timestamps and self.subtitle_renderer == "overlay":
+                captions = self._subtitle_images(profile["width"], profile["height"], profile["fps"])
+                caption_dir = os.path.join(work_dir, f"captions_{i}")
+                os.makedirs(caption_dir, exist_ok=True)
+                with tracer.span("captions", blocks=len(timestamps), profile=profile["name"]):
+                    concat_file = captions.write_concat_list(timestamps, duration, caption_dir)
+                inputs += ["-f", "concat", "-safe", "0", "-i", concat_file]
+                graph += [
+                    f"{source}{filters}[background{i}]",
+                    # converted once per caption image, so the blend and the output stay yuv420p
+                    f"[{caption_input}:v]format=yuva420p[captions{i}]",
+                    f"[background{i}][captions{i}]overlay=0:{captions.band_y}{label}"
+                ]
+                caption_input += 1
+            else:
+                if timestamps:
+                    if subtitle_file is None:
+                        subtitle_file = os.path.join(work_dir, "subtitles.ass")
+                        self._create_subtitle_ass_file(timestamps, subtitle_file, duration)
+                    # libass scales the script from its PlayRes to each output size
+                    filters += f",subtitles={subtitle_file}:fontsdir=sources/fonts:force_style='Outline=3'"
+                graph.append(f"{source}{filters}{label}")
+            labels.append(label)
+        return inputs, ["-filter_complex", ";".join(graph)], labels
+
+    def _subtitle_images(self, width: int, height: int, fps: int):
+        key = (width, height, fps)
+        if key not in self._subtitles:
+            self._subtitles[key] = SubtitleRenderer(
+                self.config["paths"]["subtitle_font"], width, height, fps,
+                cache_dir=self.config["paths"].get("subtitle_cache"), scale=height / self.height
+            )
+        return self._subtitles[key]
+
+    def _segment_count(self, audio_duration: float):
+        segments = int(self.config["config"].get("render_segments", 0) or 0)
+        min_seconds = float(self.config["config"].get("render_segment_min_seconds", 60))
+        return max(1, min(segments, int(audio_duration // min_seconds)))
+
+    def _create_video_segmented(self, files, audio, audio_duration, timestamps, output_paths, profiles, prepared, segments):
+        # video-only segments cut on background keyframes are encoded side by side, then
+        # stitched without re-encoding; the audio is muxed once so AAC frames never restart
+        plan = self._plan_backgrounds(files, audio_duration)
+        bounds = self._segment_bounds(plan, audio_duration, segments)
+        log(f"encoding {len(bounds)} segments in parallel")
+        work_dir = tempfile.mkdtemp(dir="/tmp", prefix="segments_")
+        threads = max(1, (os.cpu_count() or 1) // len(bounds))
+        if timestamps and self.subtitle_renderer == "overlay":
+            for profile in profiles:
+                self._subtitle_images(profile["width"], profile["height"], profile["fps"])
+        try:
+            with ThreadPoolExecutor(len(bounds)) as pool:
+                segment_files = list(pool.map(
+                    lambda item: self._encode_segment(item[0], *item[1], plan, timestamps, profiles, prepared, threads, work_dir),
+                    enumerate(bounds)
+                ))
+
+            ffmpeg_cmd = ["ffmpeg", "-y"]
+            for i in range(len(profiles)):
+                stitch_file = os.path.join(work_dir, f"segments_{i}.txt")
+                with open(stitch_file, "w") as f:
+                    for files_by_profile in segment_files:
+                        f.write(f"file '{files_by_profile[i]}'\n")
+                ffmpeg_cmd += ["-f", "concat", "-safe", "0", "-i", stitch_file]
+            ffmpeg_cmd += [*self._audio_input_args(audio), "-stats"]
+            for i, (profile, output_path) in enumerate(zip(profiles, output_paths)):
+                # -shortest cuts the video where the audio runs out, which drops the last
+                # frames (more of them with B-frames, whose packets are held back for
+                # reordering); the segments already add up to the exact frame count
+                ffmpeg_cmd += [
+                    "-map", f"{i}:v:0",
+                    "-map", f"{len(profiles)}:a:0",
+                    "-c:v", "copy",
+                    *audio_codec_args(profile),
+                    *container_args(profile),
+                    "-frames:v", str(int(round(audio_duration * profile["fps"]))),
+                    output_path
+                ]
+            self._run_ffmpeg(ffmpeg_cmd, "stitch", audio=audio)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _encode_segment(self, index, start, end, plan, timestamps, profiles, prepared, threads, work_dir):
+        concat_file = os.path.join(work_dir, f"concat_{index}.txt")
+        write_concat_list(self._slice_plan(plan, start, end), concat_file)
+        segment_dir = os.path.join(work_dir, f"captions_{index}")
+        os.makedirs(segment_dir)
+        caption_inputs, graph, labels = self._video_graph(
+            profiles, self._slice_timestamps(timestamps, start, end) if timestamps else None,
+            end - start, prepared, segment_dir, 1
+        )
         ffmpeg_cmd = [
             "ffmpeg", "-y",
             "-f", "concat", "-safe", "0", "-i", concat_file,
-            "-i", audio_path,
-            "-vf", f"scale={self.width}:{self.height}:force_original_aspect_ratio=increase:flags=lanczos,crop={self.width}:{self.height}",
-            "-r", "60",
-            "-c:v", "libx264",
-            "-preset", "ultrafast",
-            "-crf", "28",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-map", "0:v:0",
-            "-map", "1:a:0",
-            "-shortest",
-            "-stats",
-            output_path
+            *caption_inputs,
+            *graph,
+            "-stats"
         ]
-        if not self.config.get("debug", False):
-            subprocess.run(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, check=True)
-        else:
-            subprocess.run(ffmpeg_cmd, check=True)
+        segment_files = []
+        for i, (profile, label) in enumerate(zip(profiles, labels)):
+            # an exact frame count per segment keeps the stitched video locked to the audio
+            frames = int(round(end * profile["fps"])) - int(round(start * profile["fps"]))
+            segment_file = os.path.join(work_dir, f"segment_{index}_{i}.mp4")
+            ffmpeg_cmd += [
+                "-map", label,
+                "-r", str(profile["fps"]),
+                *video_codec_args(profile),
+                "-threads", str(threads),
+                "-frames:v", str(frames),
+                "-an",
+                segment_file
+            ]
+            segment_files.append(segment_file)
+        self._run_ffmpeg(ffmpeg_cmd, f"segment_{index}", echo=False)
+        return segment_files
+
+    def _segment_bounds(self, plan, duration: float, segments: int):
+        # cut points are background keyframes (or clip starts) closest to equal splits,
+        # snapped to the output frame grid
+        candidates = sorted({
+            round((entry["start"] + keyframe - entry["inpoint"]) * self.fps) / self.fps
+            for entry in plan
+            for keyframe in entry["keyframes"]
+            if entry["inpoint"] <= keyframe < entry["outpoint"]
+        })
+        cuts = []
+        for n in range(1, segments):
+            target = duration * n / segments
+            cut = min(candidates, key=lambda t: abs(t - target))
+            if 0 < cut < duration and (not cuts or cut > cuts[-1]):
+                cuts.append(cut)
+        return list(zip([0.0] + cuts, cuts + [duration]))
 
-        if os.path.exists(concat_file):
-            os.remove(concat_file)
+    def _slice_plan(self, plan, start: float, end: float):
+        sliced = []
+        for entry in plan:
+            entry_end = entry["start"] + entry["outpoint"] - entry["inpoint"]
+            if entry_end <= start or entry["start"] >= end:
+                continue
+            sliced.append(dict(
+                entry,
+                inpoint=entry["inpoint"] + max(0.0, start - entry["start"]),
+                outpoint=entry["inpoint"] + min(entry_end, end) - entry["start"],
+                start=max(entry["start"], start) - start
+            ))
+        return sliced
+
+    def _slice_timestamps(self, timestamps, start: float, end: float):
+        return [
+            dict(
+                ts,
+                start=max(ts["start"], start) - start,
+                end=min(ts["end"], end) - start,
+                lead=ts.get("lead", 0) + max(0.0, start - ts["start"])
+            )
+            for ts in timestamps
+            if ts["end"] > start and ts["start"] < end
+        ]
 
     def _create_concat_list(self, files, audio_duration, concat_file):
-        with open(concat_file, "w") as f:
-            current_time = 0
-            i = 0
-            while current_time < audio_duration:
-                source_file = files[i % len(files)]
-                absolute_source_file = os.path.abspath(source_file)
-                source_duration = float(subprocess.check_output([
-                    "ffprobe", "-v", "error", "-show_entries",
-                    "format=duration", "-of",
-                    "default=noprint_wrappers=1:nokey=1", source_file
-                ]).strip())
-                time_needed = min(source_duration, audio_duration - current_time)
-                f.write(f"file '{absolute_source_file}'\n")
-                f.write(f"inpoint 0\n")
-                f.write(f"outpoint {time_needed}\n")
-                f.write(f"duration {time_needed}\n")
-                current_time += time_needed
-                i += 1
+        write_concat_list(self._plan_backgrounds(files, audio_duration), concat_file)
+
+    def _plan_backgrounds(self, files, audio_duration):
+        if self.background_order == "sequential":
+            return sequential_plan(files, audio_duration)
+        plan = self.scheduler.plan(files, audio_duration)
+        log(f"backgrounds: {len(plan)} pieces from {len({entry['path'] for entry in plan})} clips")
+        return plan
 
     def __fetch_font_name(self):
         font_file = self.config['paths']['subtitle_font']
@@ -158,11 +394,15 @@ class VideoCreator:
                 start_str = self._seconds_to_ass_time(ts['start'])
                 end_str = self._seconds_to_ass_time(ts['end'])
                 text = ts['text'].replace('\n','\\N')
-                f.write(f"Dialogue: 0,{start_str},{end_str},Default,,0,0,0,,{{\\an5\\q2\\t(0,150,\\fs60,\\fs75)}}{text}\n")
+                # a caption cut by a segment boundary resumes its pop-in animation where it was
+                lead = int(round(ts.get('lead', 0) * 1000))
+                f.write(f"Dialogue: 0,{start_str},{end_str},Default,,0,0,0,,{{\\an5\\q2\\fs60\\t({-lead},{150 - lead},\\fs75)}}{text}\n")
 
     def _seconds_to_ass_time(self, seconds: float) -> str:
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        centiseconds = int((seconds - int(seconds)) * 100)
+        # rounded rather than truncated, so shifted segment timelines land on the same centisecond
+        total_centiseconds = int(round(seconds * 100))
+        hours = total_centiseconds // 360000
+        minutes = (total_centiseconds % 360000) // 6000
+        secs = (total_centiseconds % 6000) // 100
+        centiseconds = total_centiseconds % 100
         return f"{hours:d}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"